@@ -4,10 +4,22 @@ if "bpy" in locals():
     import importlib
     importlib.reload(asset_import)
     importlib.reload(morph_import)
+    importlib.reload(morph_store)
+    importlib.reload(morph_deltas)
+    importlib.reload(morph_graph)
+    importlib.reload(morph_drivers)
+    importlib.reload(corrective_morphs)
     importlib.reload(pose_import)
     importlib.reload(armature)
+    importlib.reload(cache)
+    importlib.reload(transaction)
+    importlib.reload(decode_pool)
     importlib.reload(types)
     importlib.reload(types.asset)
+    importlib.reload(types.asset_cache)
+    importlib.reload(types.disk_cache)
+    importlib.reload(types.dson_reader)
+    importlib.reload(types.document)
     importlib.reload(types.geometry)
     importlib.reload(types.geometry_library)
     importlib.reload(types.image)
@@ -17,6 +29,7 @@ if "bpy" in locals():
     importlib.reload(types.modifier)
     importlib.reload(types.modifier_instance)
     importlib.reload(types.modifier_library)
+    importlib.reload(types.morph_manifest)
     importlib.reload(types.node)
     importlib.reload(types.node_instance)
     importlib.reload(types.node_library)
@@ -28,8 +41,16 @@ else:
     from . import asset_import
     from . import types
     from . import morph_import
+    from . import morph_store
+    from . import morph_deltas
+    from . import morph_graph
+    from . import morph_drivers
+    from . import corrective_morphs
     from . import pose_import
     from . import armature
+    from . import cache
+    from . import transaction
+    from . import decode_pool
 
 import bpy
 from bpy.types import Operator, AddonPreferences
@@ -77,6 +98,14 @@ def set_debug_log_file(self, context):
     configure_logging(self.debug_file)
 
 
+def set_asset_cache_size(self, context):
+    types.asset_cache.configure(self.asset_cache_size)
+
+
+def set_cache_dir(self, context):
+    types.disk_cache.configure(bpy.path.abspath(self.cache_dir))
+
+
 class BdstAddonPreferences(AddonPreferences):
     bl_idname = __name__
 
@@ -91,6 +120,29 @@ class BdstAddonPreferences(AddonPreferences):
         subtype='FILE_PATH',
         update=set_debug_log_file
     )
+    asset_cache_size = IntProperty(
+        name="Asset Cache Size (MB)",
+        description="Memory budget for parsed files that are shared between imports, e.g. base figures",
+        default=types.asset_cache.DEFAULT_SIZE_MB,
+        min=0,
+        update=set_asset_cache_size
+    )
+    cache_dir = StringProperty(
+        name="Cache Directory",
+        default="",
+        subtype='DIR_PATH',
+        update=set_cache_dir
+    )
+    use_auto_smooth = BoolProperty(
+        name="Use Auto Smooth",
+        description="Split sharp edges with the mesh's auto smooth instead of an EdgeSplit modifier",
+        default=False
+    )
+    undo_imports = BoolProperty(
+        name="Undo Imports",
+        description="Push an undo step after each import, switch off to save time and memory with huge scenes",
+        default=True
+    )
 
     def draw(self, context):
         layout = self.layout
@@ -98,6 +150,13 @@ class BdstAddonPreferences(AddonPreferences):
         layout.prop(self, "content_root")
         layout.label(text="If set, all logging output will be written to this file")
         layout.prop(self, "debug_file")
+        layout.label(text="Parsed base figures etc. are kept in memory and reused by later imports up to this size")
+        layout.prop(self, "asset_cache_size")
+        layout.label(text="If set, parsed files are stored here and later imports load them without decoding the json")
+        layout.prop(self, "cache_dir")
+        layout.operator(cache.CacheWarmer.bl_idname, text="Warm Cache")
+        layout.prop(self, "use_auto_smooth")
+        layout.prop(self, "undo_imports")
 
 
 def register():
@@ -106,19 +165,32 @@ def register():
     bpy.types.EditBone.bdst_end_point = bpy.props.FloatVectorProperty(name="bone end point")
     bpy.types.EditBone.bdst_orientation = bpy.props.FloatVectorProperty(name="bone orientation")
     bpy.types.EditBone.bdst_instance_id = bpy.props.StringProperty(name="bone node_instance id")
+    # the same custom properties seen from the bones outside of edit mode, pose writes only read these
+    bpy.types.Bone.bdst_sign = bpy.props.StringProperty(name="bone orientation sign")
+    bpy.types.Bone.bdst_center_point = bpy.props.FloatVectorProperty(name="bone center point")
+    bpy.types.Bone.bdst_end_point = bpy.props.FloatVectorProperty(name="bone end point")
+    bpy.types.Bone.bdst_orientation = bpy.props.FloatVectorProperty(name="bone orientation")
+    bpy.types.Bone.bdst_instance_id = bpy.props.StringProperty(name="bone node_instance id")
 
     bpy.utils.register_class(BdstAddonPreferences)
     asset_import.register()
     morph_import.register()
+    morph_drivers.register()
     pose_import.register()
+    cache.register()
 
     user_preferences = bpy.context.user_preferences
     addon_prefs = user_preferences.addons["bds-tools"].preferences
     configure_logging(addon_prefs.debug_file)
+    types.asset_cache.configure(addon_prefs.asset_cache_size)
+    types.disk_cache.configure(bpy.path.abspath(addon_prefs.cache_dir))
 
 
 def unregister():
     bpy.utils.unregister_class(BdstAddonPreferences)
     asset_import.unregister()
     morph_import.unregister()
+    morph_drivers.unregister()
     pose_import.unregister()
+    cache.unregister()
+    decode_pool.shutdown()
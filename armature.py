@@ -1,4 +1,5 @@
 # contains code from https://github.com/millighost/dsf-utils
+from collections import OrderedDict
 from math import radians, degrees
 
 import bpy
@@ -115,8 +116,8 @@ def create_armature(bones):
     bpy.ops.object.mode_set(mode='OBJECT')
     configure_bones(si_arm, bone_map, armobj)
 
+    # the armature object keeps its identity transform, there is nothing to apply
     armobj.select = True
-    bpy.ops.object.transform_apply(scale=True, rotation=True)
     return bone_map, armobj
 
 
@@ -272,4 +273,72 @@ def configure_bones(armdat, bone_mapping, armobj):
     pose_bones = armobj.pose.bones
     for (bname, b_info) in bone_mapping.items():
         bbone = pose_bones[bname]
-        bbone.rotation_mode = b_info.rotation_order
\ No newline at end of file
+        bbone.rotation_mode = b_info.rotation_order
+
+_sessions = []  # running edit sessions, writes go to the outermost one
+
+
+class ArmatureEditSession:
+    """queues bone writes of an operation and applies them when the outermost session ends.
+    edit bone writes of an armature are applied in one switch to edit mode, pose bone writes
+    do not need edit mode and are applied afterwards.
+
+        with ArmatureEditSession():
+            queue_edit_bone_write(bl_armature, lambda: transform_edit_bone(...))
+            queue_pose_bone_write(lambda: apply_rotation(...))
+    """
+
+    def __init__(self):
+        self.edit_writes = OrderedDict()  # armature name -> (armature, [write])
+        self.pose_writes = []
+
+    def __enter__(self):
+        _sessions.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _sessions.remove(self)
+        if len(_sessions) > 0:
+            # nested session, hand the queued writes over to the outer one
+            outer = _sessions[0]
+            for bl_armature, writes in self.edit_writes.values():
+                for write in writes:
+                    outer.queue_edit(bl_armature, write)
+            outer.pose_writes.extend(self.pose_writes)
+        else:
+            self.flush()
+        return False
+
+    def queue_edit(self, bl_armature, write):
+        if bl_armature.name not in self.edit_writes:
+            self.edit_writes[bl_armature.name] = (bl_armature, [])
+        self.edit_writes[bl_armature.name][1].append(write)
+
+    def flush(self):
+        for bl_armature, writes in self.edit_writes.values():
+            log.debug("applying %d edit bone writes to %s" % (len(writes), bl_armature.name))
+            old_obj = bpy.context.scene.objects.active
+            bpy.context.scene.objects.active = bl_armature
+            old_mode = bl_armature.mode
+            bpy.ops.object.mode_set(mode='EDIT')
+            for write in writes:
+                write()
+            bpy.ops.object.mode_set(mode=old_mode)
+            bpy.context.scene.objects.active = old_obj
+        self.edit_writes.clear()
+
+        for write in self.pose_writes:
+            write()
+        self.pose_writes = []
+
+
+def queue_edit_bone_write(bl_armature, write):
+    """run write in edit mode of bl_armature, at the end of the running session or right away if there is none"""
+    with ArmatureEditSession():
+        _sessions[0].queue_edit(bl_armature, write)
+
+
+def queue_pose_bone_write(write):
+    """run write after the edit bone writes of the running session or right away if there is none"""
+    with ArmatureEditSession():
+        _sessions[0].pose_writes.append(write)
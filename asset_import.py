@@ -1,21 +1,20 @@
-import collections
 import os
-import re
 import time
-from collections import namedtuple, defaultdict, OrderedDict
-from math import radians, degrees
+from collections import defaultdict, OrderedDict
+from math import pi
 import urllib.parse
 
 import bpy
-import bmesh
 import logging
 import mathutils
+import numpy
 
 from bpy.props import BoolProperty, StringProperty
 
 from . import pose_import
-from .morph_import import load_all_morphs
+from .morph_import import load_all_morphs, set_morph_values, find_morph
 from .types.util import fix_broken_path
+from .transaction import ImportTransaction, link_object
 from . import types
 from . import armature
 
@@ -34,7 +33,8 @@ class AssetImporter(bpy.types.Operator):
     def execute(self, context):
         # import the file here
         log.debug("file to load %s" % self.properties.filepath)
-        load_asset(self.properties.filepath)
+        with ImportTransaction("import asset"):
+            load_asset(self.properties.filepath)
         return {"FINISHED"}
 
     def invoke(self, context, event):
@@ -47,38 +47,58 @@ def asset_import_menu(self, context):
     self.layout.operator(AssetImporter.bl_idname, text = "DSON/duf asset (.duf)")
 
 
-def find_bl_object_for_geom_id(blender_objects, geometry_id):
-    if geometry_id is None:
-        return None
-
-    geometry_id = urllib.parse.unquote(geometry_id)
-    if geometry_id.startswith("#"):
-        geometry_id = geometry_id[1:]
-
-    pattern = re.compile("%s.\d\d\d" % geometry_id)
-    for obj in blender_objects:
-        log.debug("searching geom %s -> checking %s" % (geometry_id, obj.name))
-        if obj.type == 'MESH' and (obj.data.name == geometry_id or pattern.match(obj.data.name)):
-            log.debug("match geom %s -> %s" % (geometry_id, obj.data.name))
-            return obj
-    return None
-
-
-def find_bl_object_for_node_id(blender_objects, node_id):
-    if node_id is None:
-        return None
-
-    node_id = urllib.parse.unquote(node_id)
-    if node_id.startswith("#"):
-        node_id = node_id[1:]
-
-    pattern = re.compile("%s.\d\d\d" % node_id)
-    for obj in blender_objects:
-        log.debug("searching object %s -> checking %s" % (node_id, obj.name))
-        if obj.name == node_id or pattern.match(obj.name):
-            log.debug("match obj %s -> %s" % (node_id, obj.name))
-            return obj
-    return None
+class ObjectRegistry:
+    """keeps track of the blender objects created by one import.
+    maps node instance ids, node ids and geometry instance ids to objects and parents to their children,
+    so lookups neither scan all objects nor depend on the names blender gave the objects.
+    """
+    def __init__(self):
+        self.objects = []
+        self.by_node_instance_id = {}
+        self.by_node_id = {}
+        self.by_geometry_id = {}
+        self.children_by_parent = defaultdict(list)  # parent.as_pointer() -> children
+
+    def add(self, bl_obj, node, geom=None):
+        self.objects.append(bl_obj)
+        self.by_node_instance_id.setdefault(node.id, bl_obj)
+        self.by_node_id.setdefault(node.node.id, bl_obj)
+        if geom is not None:
+            self.by_geometry_id.setdefault(geom.id, bl_obj)
+
+    def find_by_geometry(self, url):
+        if url is None:
+            return None
+        return self.by_geometry_id.get(url_to_id(url), None)
+
+    def find_by_node(self, url):
+        if url is None:
+            return None
+        id = url_to_id(url)
+        return self.by_node_instance_id.get(id, None) or self.by_node_id.get(id, None)
+
+    def set_parent(self, bl_obj, bl_parent):
+        bl_obj.parent = bl_parent
+        self.add_child(bl_parent, bl_obj)
+
+    def add_child(self, bl_parent, bl_obj):
+        """record a parent relationship that was set up elsewhere"""
+        self.children_by_parent[bl_parent.as_pointer()].append(bl_obj)
+
+    def direct_children(self, bl_parent):
+        return self.children_by_parent.get(bl_parent.as_pointer(), [])
+
+    def all_children(self, bl_parent):
+        all_children = []
+        for child in self.direct_children(bl_parent):
+            all_children.append(child)
+            all_children.extend(self.all_children(child))
+        return all_children
+
+
+def url_to_id(url):
+    url = urllib.parse.unquote(url)
+    return url.split("#")[-1]
 
 
 def find_root_object(bl_object):
@@ -88,21 +108,6 @@ def find_root_object(bl_object):
     return tmp
 
 
-def find_all_children(blender_objects, bl_parent):
-    children = find_direct_children(blender_objects, bl_parent)
-    if len(children) == 0:
-        return []
-
-    all_children = children
-    for child in children:
-        all_children.extend(find_all_children(blender_objects, child))
-    return all_children
-
-
-def find_direct_children(blender_objects, bl_parent):
-    return [child for child in blender_objects if child.parent == bl_parent]
-
-
 def load_asset(filepath):
     start_time = time.time()
 
@@ -110,9 +115,9 @@ def load_asset(filepath):
     active_object = bpy.context.active_object
     active_is_selected = len(bpy.context.selected_objects) > 0
 
-    asset = types.Asset(filepath)
+    asset = types.get_asset(filepath)
 
-    blender_objects = []
+    registry = ObjectRegistry()
     bones = OrderedDict()  # uses node_instance id as key
     bone_node_ids = []     # uses node id
     armature_children = []
@@ -120,7 +125,7 @@ def load_asset(filepath):
         bl_obj = None
         for geom in node.geometries:  # XXX: might be better to create one bl_object from multiple geometries here
             bl_obj = create_object_from_geometry(node, geom)
-            blender_objects.append(bl_obj)
+            registry.add(bl_obj, node, geom)
 
             dir_name = os.path.dirname(geom.asset.filepath)
             morphs_path = os.path.join(dir_name, "Morphs")
@@ -129,7 +134,7 @@ def load_asset(filepath):
         if node.type == "node" and len(node.geometries) == 0:
             # this is a group node, use an emtpy
             bl_obj = create_empty(node)
-            blender_objects.append(bl_obj)
+            registry.add(bl_obj, node)
 
         def is_figure_but_not_clothing(node): return node.type == "figure" and node.parent is None
         def is_standalone_clothing(node): return node.type == "figure" and "@selection" in node.parent
@@ -144,23 +149,25 @@ def load_asset(filepath):
             bones[node.id] = node
             bone_node_ids.append(node.node.id)
 
-    # slow, but needed to calculate sharp edges
-    bl_obj_to_ek = prepare_edges_faces_dict(blender_objects)
-
+    face_materials = OrderedDict()  # object name -> FaceMaterials
     for material in asset.scene.materials:
         geometry_id = material.geometry
         geometry = asset.find_geometry_instance(geometry_id)
-        bl_obj = find_bl_object_for_geom_id(blender_objects, geometry_id)
-        uv_map_name = find_uv_map_for_material(asset, material, bl_obj)
+        bl_obj = registry.find_by_geometry(geometry_id)
+        uv_map_name = find_uv_map_for_material(asset, material, bl_obj, geometry)
         bl_mat = create_cycles_material(asset, bl_obj, material, uv_map_name)
-        assign_material_to_groups(bl_obj, bl_mat, bl_obj_to_ek, material, geometry)
+        if bl_obj.name not in face_materials:
+            face_materials[bl_obj.name] = FaceMaterials(bl_obj)
+        assign_material_to_groups(face_materials[bl_obj.name], material, geometry)
+    for bl_face_materials in face_materials.values():
+        bl_face_materials.apply()
 
     if active_object and active_is_selected and active_object.type == 'ARMATURE' and len(armature_children) > 0:
         bl_armature = active_object
     else:
         _, bl_armature = armature.create_armature(list(bones.values()))
     if bl_armature is not None and len(armature_children) > 0:
-        armature_children[0].parent = bl_armature
+        registry.set_parent(armature_children[0], bl_armature)
 
     # setup parent relationships (so children will get affected by transforms later)
     geometry_nodes = [node for node in asset.scene.nodes if node.type in ["node", "figure"]]
@@ -172,23 +179,24 @@ def load_asset(filepath):
             # sometimes parent is not set but conform_target is
             parent = node.conform_target
 
-        bl_parent = find_bl_object_for_geom_id(blender_objects, parent)
+        bl_parent = registry.find_by_geometry(parent)
         if bl_parent is None:
-            bl_parent = find_bl_object_for_node_id(blender_objects, parent)
+            bl_parent = registry.find_by_node(parent)
         if bl_parent is None and bl_armature is not None and parent is not None:
             bl_parent = bl_armature
         if bl_parent is not None and bl_parent is not bl_armature:
-            bl_obj = find_bl_object_for_node_id(blender_objects, node.id)
-            bl_obj.parent = bl_parent
+            bl_obj = registry.find_by_node(node.id)
+            registry.set_parent(bl_obj, bl_parent)
             # important!: set parent but keep transformation
             bl_obj.matrix_parent_inverse = bl_parent.matrix_world.inverted()
         if bl_parent is not None and bl_parent is bl_armature:
-            bl_obj = find_bl_object_for_node_id(blender_objects, node.id)
+            bl_obj = registry.find_by_node(node.id)
             set_bone_as_relative_parent(bl_obj, bl_armature, bones[parent[1:]])
+            registry.add_child(bl_armature, bl_obj)
 
     # do necessary transforms
     for node in geometry_nodes:
-        bl_obj = find_bl_object_for_node_id(blender_objects, node.id)
+        bl_obj = registry.find_by_node(node.id)
 
         if bl_armature is not None and bl_obj.parent == bl_armature and node.type != "node":
             # if the object is a direct child of an armature we have to transform the armature object instead
@@ -207,24 +215,27 @@ def load_asset(filepath):
         bl_obj.scale = node.scale
         bl_obj.scale *= node.general_scale
 
+    morph_values = OrderedDict()  # object name -> (object, {morph id: value})
     for modifier in asset.scene.modifiers:
         if modifier.type == "skin":
-            bl_obj = find_bl_object_for_geom_id(blender_objects, modifier.parent)
+            bl_obj = registry.find_by_geometry(modifier.parent)
             if bl_obj is None:
-                bl_obj = find_bl_object_for_node_id(blender_objects, modifier.parent)
+                bl_obj = registry.find_by_node(modifier.parent)
             for joint in modifier.skin.joints.values():
                 create_weight_group(bl_obj, joint, bones)
         elif modifier.type == "morph" and modifier.parent and modifier.channel:
-            bl_obj = find_bl_object_for_node_id(blender_objects, modifier.parent)
+            bl_obj = registry.find_by_node(modifier.parent)
             if bl_obj is None:
                 continue
-            bl_morph = bl_obj.bdst_morphs.get(modifier.modifier.id, None)
-            if bl_morph:
-                bpy.context.scene.objects.active = bl_obj
-                bl_morph.value = modifier.channel.current_value
+            if find_morph(bl_obj, modifier.modifier.id) is not None:
+                if bl_obj.name not in morph_values:
+                    morph_values[bl_obj.name] = (bl_obj, {})
+                morph_values[bl_obj.name][1][modifier.modifier.id] = modifier.channel.current_value
+    for bl_obj, values in morph_values.values():
+        set_morph_values(bl_obj, values)
 
     if bl_armature is not None:
-        children = find_all_children(blender_objects, bl_armature)
+        children = registry.all_children(bl_armature)
         for child in children:
             modifier = child.modifiers.new("Armature", type='ARMATURE')
             modifier.object = bl_armature
@@ -233,7 +244,7 @@ def load_asset(filepath):
 
     end_time = time.time()
     elapsed_time = end_time - start_time
-    log.info("imported %d objects in %.3f seconds" % (len(blender_objects), elapsed_time))
+    log.info("imported %d objects in %.3f seconds" % (len(registry.objects), elapsed_time))
 
 
 def create_weight_group(obj, joint, bones):
@@ -250,7 +261,7 @@ def create_weight_group(obj, joint, bones):
     bone_head = node.center_point
     bone_tail = node.end_point
 
-    calc_weights = []
+    calc_weights = None
     if joint.local_weights is not None:
         # find longitudinal axis of the bone and take the other two into consideration
         consider = []
@@ -265,21 +276,14 @@ def create_weight_group(obj, joint, bones):
         if z_delta < max_delta:
             consider.append("z")
 
-        # create deques sorted in descending order
-        weights = [collections.deque(joint.local_weights[letter]) for letter in consider if letter in joint.local_weights]
-        for w in weights:
-            w.reverse()
-
-        target = []
-        if len(weights) == 1:
+        weights = [joint.local_weights[letter] for letter in consider if letter in joint.local_weights]
+        if len(weights) > 0:
             calc_weights = weights[0]
-        elif len(weights) > 1:
-            merge_weights(weights[0], weights[1], target)
-            calc_weights = target
+        if len(weights) > 1:
+            calc_weights = calc_weights.merge(weights[1])
         if len(weights) > 2:
             # this happens mostly with zero length bones
-            calc_weights = []
-            merge_weights(target, weights[2], calc_weights)
+            calc_weights = calc_weights.merge(weights[2])
     elif joint.node_weights is not None:
         calc_weights = joint.node_weights
 
@@ -288,101 +292,114 @@ def create_weight_group(obj, joint, bones):
         vg = obj.vertex_groups[vg_name]
         obj.vertex_groups.remove(vg)
     vg = obj.vertex_groups.new(name=vg_name)
-    for vw in calc_weights:
-        if vw[1] >= 0.001:
-            vg.add([vw[0]], vw[1], "REPLACE")
-
-
-def merge_weights(first, second, target):
-    # merge the two local_weight groups and calculate arithmetic mean for vertices that are present in both groups
-    while len(first) > 0 and len(second) > 0:
-        a = first.pop()
-        b = second.pop()
-        if a[0] == b[0]:
-            target.append([a[0], (a[1] + b[1]) / 2.0])
-        elif a[0] < b[0]:
-            target.append(a)
-            second.append(b)
-        else:
-            target.append(b)
-            first.append(a)
-    while len(first) > 0:
-        a = first.pop()
-        target.append(a)
-    while len(second) > 0:
-        b = second.pop()
-        target.append(b)
-
-
-def prepare_edges_faces_dict(blender_objects):
-    # for finding edges and faces by edge_key
-    result = {}
-    for bl_obj in blender_objects:
-        if bl_obj.type != 'MESH':
-            continue
+    if calc_weights is not None:
+        add_weights(vg, calc_weights)
+
+
+def add_weights(vg, vertex_weights):
+    """add the weights to the vertex group with one call per distinct weight"""
+    keep = vertex_weights.weights >= 0.001
+    indices = vertex_weights.indices[keep]
+    values, inverse = numpy.unique(vertex_weights.weights[keep], return_inverse=True)
+    order = numpy.argsort(inverse, kind="mergesort")
+    bounds = numpy.searchsorted(inverse[order], numpy.arange(len(values) + 1))
+    for i, weight in enumerate(values.tolist()):
+        vg.add(indices[order[bounds[i]:bounds[i + 1]]].tolist(), weight, "REPLACE")
+
+
+class FaceMaterials:
+    """material index, smooth flag and smooth angle per face of a mesh, written to the mesh at once by apply"""
+    def __init__(self, bl_obj):
+        self.bl_obj = bl_obj
+        polygons = bl_obj.data.polygons
+        self.material_indices = numpy.zeros(len(polygons), dtype=numpy.int32)
+        polygons.foreach_get("material_index", self.material_indices)
+        self.use_smooth = numpy.zeros(len(polygons), dtype=bool)
+        polygons.foreach_get("use_smooth", self.use_smooth)
+        self.smooth_angles = None  # only created if a material has a smooth angle
+
+    def assign(self, faces, material_idx, use_smooth, smooth_angle):
+        self.material_indices[faces] = material_idx
+        self.use_smooth[faces] = use_smooth
+        if smooth_angle >= 0:
+            if self.smooth_angles is None:
+                self.smooth_angles = numpy.full(len(self.material_indices), -1.0)
+            self.smooth_angles[faces] = smooth_angle
+
+    def apply(self):
+        polygons = self.bl_obj.data.polygons
+        polygons.foreach_set("material_index", self.material_indices)
+        polygons.foreach_set("use_smooth", self.use_smooth)
+        if self.smooth_angles is not None:
+            mark_sharp_edges(self.bl_obj, self.smooth_angles)
+
+
+def assign_material_to_groups(bl_face_materials, material, geometry):
+    """assign the last material of the object to the faces of the material's groups"""
+    material_idx = len(bl_face_materials.bl_obj.data.materials) - 1
+    smooth_chan = material.find_extra_channel("Smooth On")
+    use_smooth = smooth_chan.current_value if smooth_chan and smooth_chan.current_value is not None else False
+    smooth_angle_chan = material.find_extra_channel("Smooth Angle")
+    smooth_angle = smooth_angle_chan.current_value if smooth_angle_chan and smooth_angle_chan.current_value is not None else -1
+
+    faces = geometry.face_remap[geometry.mat_groups_to_faces(material.groups)]
+    faces = faces[faces >= 0]
+    bl_face_materials.assign(faces, material_idx, bool(use_smooth), smooth_angle)
+
+
+def mark_sharp_edges(bl_obj, face_smooth_angles):
+    """mark edges between two faces as sharp if the angle of the face normals is at least the smooth angle
+    of one of the faces. faces without smooth angle are -1 in face_smooth_angles.
+    """
+    mesh = bl_obj.data
+    face_count = len(mesh.polygons)
+    normals = numpy.zeros(face_count * 3, dtype=numpy.float32)
+    mesh.polygons.foreach_get("normal", normals)
+    normals = normals.reshape(-1, 3).astype(numpy.float64)
+    loop_totals = numpy.zeros(face_count, dtype=numpy.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    loop_edges = numpy.zeros(len(mesh.loops), dtype=numpy.int32)
+    mesh.loops.foreach_get("edge_index", loop_edges)
+    loop_faces = numpy.repeat(numpy.arange(face_count), loop_totals)
+
+    # face pairs of all edges with exactly two faces
+    order = numpy.argsort(loop_edges, kind="mergesort")
+    sorted_edges = loop_edges[order]
+    face_counts = numpy.bincount(loop_edges, minlength=len(mesh.edges))
+    starts = numpy.searchsorted(sorted_edges, numpy.nonzero(face_counts == 2)[0])
+    edges = sorted_edges[starts]
+    face0 = loop_faces[order[starts]]
+    face1 = loop_faces[order[starts + 1]]
+
+    thresholds = numpy.where(face_smooth_angles < 0, numpy.inf, face_smooth_angles)
+    threshold = numpy.minimum(thresholds[face0], thresholds[face1])
+
+    lengths = numpy.linalg.norm(normals, axis=1)
+    valid = (lengths[face0] > 0) & (lengths[face1] > 0)
+    cos = numpy.einsum("ij,ij->i", normals[face0], normals[face1]) / numpy.where(valid, lengths[face0] * lengths[face1], 1)
+    angle = numpy.degrees(numpy.arccos(numpy.clip(cos, -1, 1)))
+    sharp_edges = edges[valid & (angle >= threshold)]
+    if len(sharp_edges) == 0:
+        return
+
+    use_edge_sharp = numpy.zeros(len(mesh.edges), dtype=bool)
+    mesh.edges.foreach_get("use_edge_sharp", use_edge_sharp)
+    use_edge_sharp[sharp_edges] = True
+    mesh.edges.foreach_set("use_edge_sharp", use_edge_sharp)
 
-        result[bl_obj.name] = {}
-
-        e_to_f = defaultdict(lambda: [])
-        result[bl_obj.name]["e_to_f"] = e_to_f
-        for i, p in enumerate(bl_obj.data.polygons):
-            for ek in p.edge_keys:
-                e_to_f[ek].append(i)
-
-        result[bl_obj.name]["e_to_e"] = {ek: bl_obj.data.edges[i] for i, ek in enumerate(bl_obj.data.edge_keys)}
-    return result
-
-
-def assign_material_to_groups(bl_obj, bl_mat, bl_obj_to_ek, material, geometry):
-    groups = material.groups
-    material_idx = find_material_index(bl_obj, bl_mat)
-    for group in groups:
-        smooth_chan = material.find_extra_channel("Smooth On")
-        use_smooth = smooth_chan.current_value if smooth_chan and smooth_chan.current_value is not None else False
-        smooth_angle_chan = material.find_extra_channel("Smooth Angle")
-        smooth_angle = smooth_angle_chan.current_value if smooth_angle_chan and smooth_angle_chan.current_value is not None else -1
-
-        faces = geometry.mat_group_to_faces(group)
-
-        for face_idx in faces:
-            # XXX: this check is necessary because we might have deleted some invalid faces
-            # XXX: this also means that some materials might be assigned to the wrong faces...
-            if face_idx < len(bl_obj.data.polygons):
-                poly = bl_obj.data.polygons[face_idx]
-                poly.material_index = material_idx
-                poly.use_smooth = use_smooth
-                if smooth_angle >= 0:
-                    handle_smooth_angle(bl_obj, bl_obj_to_ek, poly, smooth_angle)
-
-
-def handle_smooth_angle(bl_obj, bl_obj_to_ek, poly, smooth_angle):
-    for ek in poly.edge_keys:
-        polys = bl_obj_to_ek[bl_obj.name]["e_to_f"][ek]
-        if len(polys) == 2:
-            # log.debug("len polys is 2")
-            normal0 = mathutils.Vector(bl_obj.data.polygons[polys[0]].normal)
-            normal1 = mathutils.Vector(bl_obj.data.polygons[polys[1]].normal)
-            try:
-                angle = degrees(normal0.angle(normal1))
-            except:
-                angle = -1
-            # log.debug("************** angle: %.3f" % angle)
-            if angle >= smooth_angle:
-                edge = bl_obj_to_ek[bl_obj.name]["e_to_e"][ek]
-                # log.debug("setting edge to sharp")
-                edge.use_edge_sharp = True
-                if "EdgeSplit" not in bl_obj.modifiers:
-                    modifier = bl_obj.modifiers.new("EdgeSplit", type='EDGE_SPLIT')
-                    modifier.use_edge_angle = False
-                    modifier.use_edge_sharp = True
-
-
-def find_material_index(bl_obj, bl_mat):
-    index = 0
-    for i, mat_slot in enumerate(bl_obj.material_slots):
-        if mat_slot.material is not None and mat_slot.name == bl_mat.name:
-            index = i
-    return index
+    if use_auto_smooth():
+        # auto smooth at 180 degrees splits only the sharp edges, without the extra geometry of EdgeSplit
+        mesh.use_auto_smooth = True
+        mesh.auto_smooth_angle = pi
+    elif "EdgeSplit" not in bl_obj.modifiers:
+        modifier = bl_obj.modifiers.new("EdgeSplit", type='EDGE_SPLIT')
+        modifier.use_edge_angle = False
+        modifier.use_edge_sharp = True
+
+
+def use_auto_smooth():
+    addon_prefs = bpy.context.user_preferences.addons["bds-tools"].preferences
+    return addon_prefs.use_auto_smooth
 
 
 def load_node_group(node_group_name):
@@ -518,138 +535,106 @@ def create_cycles_material(asset, bl_obj, material, uv_map_name):
 
 
 def create_object_from_geometry(node, geom):
-    bmesh_mesh = bmesh.new()
-    for v in geom.vertices:
-        bmesh_mesh.verts.new(v)
-
-    bmesh_mesh.verts.ensure_lookup_table()
-
-    for (face_idx, face_vis) in enumerate(geom.faces):
-        face_verts = [bmesh_mesh.verts[vi] for vi in face_vis]
-
-        # ensure enough and unique vertices per face
-        if len(face_verts) > 2 and len(face_verts) == len(set(face_verts)):
-            try:
-                bmesh_mesh.faces.new(face_verts)
-            except ValueError as e:
-                log.error("while trying to create face: %s" % e)
-        else:
-            # this is bad because it changes face indexes
-            log.debug("error in " + geom.id)
-            log.debug([vi for vi in face_vis])
-
-    obj = create_blender_mesh_object(node.id, geom.id, bmesh_mesh)
+    obj = create_blender_mesh_object(node.id, geom.id, geom)
     set_origin_point(obj, node.center_point)
-    create_vertex_groups(obj, geom.poly_groups)
-    create_vertex_groups(obj, geom.mat_groups)
-    create_uv_map(obj, geom.default_uv_set)
+    create_vertex_groups(obj, geom.poly_groups())
+    create_vertex_groups(obj, geom.mat_groups())
+    create_uv_map(obj, geom, geom.default_uv_set)
     return obj
 
 
 def set_origin_point(bl_obj, center_point):
+    """move the origin of a newly created object (identity transform) to center_point.
+    the vertices are offset directly, no operators or scene updates are involved.
+    """
     log.debug("setting origin point %s %s" % (bl_obj.name, center_point))
-    old_obj = bpy.context.active_object
-    for item in bpy.context.selectable_objects:
-        item.select = False
-
-    bpy.context.scene.objects.active = bl_obj
-    bl_obj.select = True
-
-    old_mode = bl_obj.mode
-    old_cursor_pos = bpy.context.scene.cursor_location.copy()
-    bpy.context.scene.cursor_location = center_point
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.origin_set(type='ORIGIN_CURSOR')
-    bpy.context.scene.cursor_location = old_cursor_pos
-    bpy.ops.object.mode_set(mode=old_mode)
-    bpy.context.scene.objects.active = old_obj
-    for item in bpy.context.selectable_objects:
-        item.select = False
+    center = mathutils.Vector(center_point)
+    bl_obj.data.transform(mathutils.Matrix.Translation(-center))
+    bl_obj.matrix_world = mathutils.Matrix.Translation(center)
 
 
 def create_vertex_groups(obj, groups):
-    for group in groups:
-        vg = obj.vertex_groups.new(name=group["name"])
+    for name, vertices in groups:
+        vg = obj.vertex_groups.new(name=name)
         weight = 1.0
-        for vi in group["vertices"]:
-            vg.add([vi], weight, "REPLACE")
+        vg.add(vertices.tolist(), weight, "REPLACE")
 
 
-def find_uv_map_for_material(asset, material, bl_obj):
+def find_uv_map_for_material(asset, material, bl_obj, geometry):
     uv_set = asset.find_uv_set(material.uv_set)
     if uv_set and uv_set.id in bl_obj.data.uv_layers:
         return bl_obj.data.uv_layers[uv_set.id].name
     elif uv_set:
-        create_uv_map(bl_obj, uv_set)
+        create_uv_map(bl_obj, geometry, uv_set)
         return uv_set.id
     else:
         return bl_obj.data.uv_layers[0].name
 
 
-def create_uv_map(bl_obj, uv_set):
+def create_uv_map(bl_obj, geom, uv_set):
     if uv_set is None:
         return
 
     bl_mesh = bl_obj.data
     bl_uv_tex = bl_mesh.uv_textures.new(name=uv_set.id)
-    bl_uv_lay = bl_mesh.uv_layers[-1]
-    uvoff = 0
-    for bl_polygon in bl_mesh.polygons:
-        uvs = uv_set.get_uvs(bl_polygon.index, bl_polygon.vertices)
-        for uv_rel_idx in range(len(bl_polygon.vertices)):
-            uv_pair = uvs[uv_rel_idx]
-            uv_abs_idx = uvoff + uv_rel_idx
-            bl_uv_lay.data[uv_abs_idx].uv = uv_pair
-        uvoff += len(bl_polygon.vertices)
-
-
-def create_blender_mesh_object(obj_name, mesh_name, bmesh_mesh):
+    bl_uv_lay = bl_mesh.uv_layers[bl_uv_tex.name]
+    uvs = uv_set.loop_uvs(*geom.mesh_loops())
+    bl_uv_lay.data.foreach_set("uv", numpy.ascontiguousarray(uvs, dtype=numpy.float32).ravel())
+
+
+def create_blender_mesh_object(obj_name, mesh_name, geom):
     me = bpy.data.meshes.new(mesh_name)
     ob = bpy.data.objects.new(obj_name, me)
-    bmesh_mesh.to_mesh(me)
-    bmesh_mesh.free()
-    scn = bpy.context.scene
-    scn.objects.link(ob)
-    me.update()
+    fill_mesh(me, geom)
+    link_object(ob)
     return ob
 
 
+def fill_mesh(me, geom):
+    """write vertices and valid faces of geom into the empty mesh me, see Geometry.face_remap"""
+    kept = geom.face_remap >= 0
+    if not kept.all():
+        log.debug("%d invalid faces in %s" % (len(kept) - numpy.count_nonzero(kept), geom.id))
+    loop_totals = geom.face_sizes[kept].astype(numpy.int32)
+    loop_starts = (numpy.cumsum(loop_totals) - loop_totals).astype(numpy.int32)
+    _, loop_vertices = geom.mesh_loops()
+    loop_vertices = loop_vertices.astype(numpy.int32)
+
+    me.vertices.add(len(geom.vertices))
+    me.vertices.foreach_set("co", numpy.ascontiguousarray(geom.vertices, dtype=numpy.float32).ravel())
+    me.loops.add(len(loop_vertices))
+    me.loops.foreach_set("vertex_index", loop_vertices)
+    me.polygons.add(len(loop_totals))
+    me.polygons.foreach_set("loop_start", loop_starts)
+    me.polygons.foreach_set("loop_total", loop_totals)
+    me.update(calc_edges=True)
+
+
 def create_empty(node):
     empty = bpy.data.objects.new(node.id, None)
     empty.empty_draw_type = 'PLAIN_AXES'
-    scn = bpy.context.scene
-    scn.objects.link(empty)
-    scn.update()
+    link_object(empty)
     return empty
 
 
 def transform_bones(bones, bl_armature):
-    old_obj = bpy.context.active_object
-    bpy.context.scene.objects.active = bl_armature
-    old_mode = bl_armature.mode
-    bpy.ops.object.mode_set(mode='EDIT')
     for bone in bones:
         bone_id = bone.node.id
         log.debug("apply pose to %s %s" % (bone_id, bone._rotation))
         pose_import.apply_rotation(bl_armature, bone_id, *bone._rotation)
-    bpy.ops.object.mode_set(mode=old_mode)
-    bpy.context.scene.objects.active = old_obj
-    old_obj.select = True
 
 
 def set_bone_as_relative_parent(bl_obj, bl_armature, bone_node):
-    old_obj = bpy.context.active_object
-    for item in bpy.context.selectable_objects:
-        item.select = False
-    bl_obj.select = True
-    bl_armature.select = True
-    bpy.context.scene.objects.active = bl_armature
-    bl_armature.data.bones.active = bl_armature.data.bones[bone_node.node.id]
-    bpy.ops.object.parent_set(type='BONE_RELATIVE')
-    for item in bpy.context.selectable_objects:
-        item.select = False
-    bpy.context.scene.objects.active = old_obj
-    old_obj.select = True
+    """same result as parent_set(type='BONE_RELATIVE'), but without selecting objects and calling the operator.
+    a relative bone parent follows the bone's channel matrix, its inverse keeps the object where it is.
+    """
+    bone_id = bone_node.node.id
+    bl_armature.data.bones[bone_id].use_relative_parent = True
+    bl_obj.parent = bl_armature
+    bl_obj.parent_type = 'BONE'
+    bl_obj.parent_bone = bone_id
+    parent_matrix = bl_armature.matrix_world * bl_armature.pose.bones[bone_id].matrix_channel
+    bl_obj.matrix_parent_inverse = parent_matrix.inverted()
 
 
 def register():
@@ -0,0 +1,69 @@
+import fnmatch
+import logging
+import os
+import time
+
+import bpy
+
+from bpy.props import StringProperty
+
+from .types import disk_cache
+from .types.document import load_document
+
+log = logging.getLogger(__name__)
+
+
+class CacheWarmer(bpy.types.Operator):
+    bl_label = "warm DSON cache"
+    bl_idname = "bdst.warm_cache"
+    bl_description = "Parse all dsf/duf files below a directory and store them in the cache directory"
+
+    use_filter_folder = True
+    filepath = StringProperty(
+            name="file path",
+            description="directory that will be cached, e.g. data/DAZ 3D/Genesis 3",
+            maxlen=1000,
+            subtype="DIR_PATH",
+            default="")
+
+    def execute(self, context):
+        if not disk_cache.is_enabled():
+            self.report({'ERROR'}, "Set a cache directory in the add-on preferences first")
+            return {"CANCELLED"}
+        warm_cache(self.properties.filepath)
+        return {"FINISHED"}
+
+    def invoke(self, context, event):
+        # show file selection dialog
+        context.window_manager.fileselect_add(self)
+        return {"RUNNING_MODAL"}
+
+
+def warm_cache(dir):
+    start_time = time.time()
+
+    files = []
+    for root, dirnames, filenames in os.walk(dir):
+        for filename in filenames:
+            if fnmatch.fnmatch(filename, "*.dsf") or fnmatch.fnmatch(filename, "*.duf"):
+                files.append(os.path.join(root, filename))
+
+    for file in files:
+        if disk_cache.contains(file):
+            continue
+        try:
+            load_document(file)
+        except Exception as e:
+            log.error("could not cache %s: %s" % (file, e))
+
+    end_time = time.time()
+    elapsed_time = end_time - start_time
+    log.info("cached %d files in %.3f seconds" % (len(files), elapsed_time))
+
+
+def register():
+    bpy.utils.register_class(CacheWarmer)
+
+
+def unregister():
+    bpy.utils.unregister_class(CacheWarmer)
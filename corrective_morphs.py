@@ -0,0 +1,97 @@
+import logging
+
+import numpy
+
+from . import morph_drivers
+from . import morph_graph
+from . import morph_store
+
+log = logging.getLogger(__name__)
+
+# smaller changes of a bone channel (in DSON units, degrees or cm) do not update the correctives
+CHANGE_THRESHOLD = 0.01
+
+_bone_inputs = {}  # cache key, see morph_store.cache_key -> BoneInputs
+
+
+class BoneInputs:
+    """the pose bone channels a morph graph reads, e.g. the bends of joint controlled morphs (JCMs).
+    all channels of a kind are read with one foreach_get of the armature's pose bones. the values seen last
+    are kept, so only the inputs of bones that actually moved are passed on to the graph.
+    """
+
+    def __init__(self, bl_obj, graph):
+        self.graph = graph
+        self.bl_armature = morph_drivers.find_armature(bl_obj)
+        self.bone_count = len(self.bl_armature.pose.bones) if self.bl_armature is not None else 0
+        self.last_values = None
+        # property -> (positions in bone_inputs, flat indices into the foreach_get array, factors)
+        self.channels = {}
+        # bones that feed no correctives, their inputs stay unresolved
+        self.values = numpy.full(len(graph.bone_inputs), morph_graph.UNRESOLVED_VALUE)
+        if self.bl_armature is None:
+            return
+
+        pose_bones = self.bl_armature.pose.bones
+        channels = {}
+        for k, (bone_id, path) in enumerate(graph.bone_inputs):
+            channel = morph_drivers.input_channel(self.bl_armature, bone_id, path)
+            if channel is None:
+                log.warning("%s: bone %s of corrective morph input not found" % (bl_obj.name, bone_id))
+                continue
+            bone_name, prop, index, factor = channel
+            positions, flat_indices, factors = channels.setdefault(prop, ([], [], []))
+            positions.append(k)
+            flat_indices.append(pose_bones.find(bone_name) * 3 + index)
+            factors.append(factor)
+        for prop, (positions, flat_indices, factors) in channels.items():
+            self.channels[prop] = (numpy.array(positions, dtype=numpy.int64),
+                                   numpy.array(flat_indices, dtype=numpy.int64),
+                                   numpy.array(factors, dtype=numpy.float64))
+
+    def is_valid(self, bl_obj, graph):
+        bl_armature = morph_drivers.find_armature(bl_obj)
+        if graph is not self.graph or bl_armature != self.bl_armature:
+            return False
+        return bl_armature is None or len(bl_armature.pose.bones) == self.bone_count
+
+    def read(self):
+        """current DSON values of all bone inputs, in the order of graph.bone_inputs"""
+        pose_bones = self.bl_armature.pose.bones if self.bl_armature is not None else []
+        for prop, (positions, flat_indices, factors) in self.channels.items():
+            flat = numpy.empty(len(pose_bones) * 3, dtype=numpy.float32)
+            pose_bones.foreach_get(prop, flat)
+            self.values[positions] = flat[flat_indices] * factors
+        return self.values
+
+    def value(self, i):
+        """value of the graph input i, a bone input, as of the last read"""
+        return float(self.values[i - self.graph.morph_count])
+
+    def changed(self):
+        """read the bone inputs and return the graph indices of those that changed since the last call,
+        all of them on the first call
+        """
+        values = self.read()
+        if self.last_values is None:
+            moved = numpy.arange(len(values))
+            self.last_values = values.copy()
+        else:
+            moved = numpy.nonzero(numpy.abs(values - self.last_values) > CHANGE_THRESHOLD)[0]
+            # channels below the threshold keep their old value, so slow movements add up
+            self.last_values[moved] = values[moved]
+        return (moved + self.graph.morph_count).tolist()
+
+
+def get_bone_inputs(bl_obj, graph):
+    """the BoneInputs of bl_obj for its current morph graph"""
+    key = morph_store.cache_key(bl_obj)
+    bone_inputs = _bone_inputs.get(key, None)
+    if bone_inputs is None or not bone_inputs.is_valid(bl_obj, graph):
+        bone_inputs = BoneInputs(bl_obj, graph)
+        _bone_inputs[key] = bone_inputs
+    return bone_inputs
+
+
+def clear():
+    _bone_inputs.clear()
@@ -0,0 +1,72 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import sys
+
+import bpy
+
+from .types import disk_cache
+from .types.modifier import MorphInfo
+from .types.morph_manifest import read_all_morph_infos
+
+log = logging.getLogger(__name__)
+
+WORKER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker")
+# fewer files are decoded on the main thread, starting the workers would take longer
+MIN_PARALLEL_FILES = 8
+
+_executor = None
+
+
+def get_executor():
+    """process pool with one worker per core, started on first use and kept for the session"""
+    global _executor
+    if _executor is None:
+        # the workers import bdst_morph_worker as top-level module, they inherit sys.path
+        if WORKER_DIR not in sys.path:
+            sys.path.append(WORKER_DIR)
+        # sys.executable is blender itself, the workers need a plain python interpreter
+        python = getattr(bpy.app, "binary_path_python", None)
+        if python and os.path.exists(python):
+            multiprocessing.set_executable(python)
+        workers = multiprocessing.cpu_count()
+        log.info("starting %d morph decoding processes" % workers)
+        _executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+
+def parallel_read_all_morph_infos(filepaths):
+    """same as read_all_morph_infos, but the files are decoded in the process pool.
+    yields (filepath, MorphInfos) in the order of filepaths as soon as the files are decoded.
+    """
+    if len(filepaths) < MIN_PARALLEL_FILES or multiprocessing.cpu_count() < 2:
+        yield from read_all_morph_infos(filepaths)
+        return
+
+    try:
+        executor = get_executor()
+        import bdst_morph_worker
+        cache_dir = disk_cache.get_cache_dir()
+        futures = [executor.submit(bdst_morph_worker.read_morph_infos, f, cache_dir) for f in filepaths]
+    except Exception as e:
+        log.error("could not start morph decoding processes, decoding on the main thread: %s" % e)
+        shutdown()
+        yield from read_all_morph_infos(filepaths)
+        return
+
+    for filepath, future in zip(filepaths, futures):
+        try:
+            infos = [MorphInfo.from_json(info) for info in future.result()]
+        except Exception as e:
+            # e.g. a worker died, try again here
+            log.error("morph decoding process failed for %s: %s" % (filepath, e))
+            _, infos = next(read_all_morph_infos([filepath]))
+        yield filepath, infos
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import logging
+import os
+
+import numpy
+
+from . import types
+from .types import disk_cache
+
+log = logging.getLogger(__name__)
+
+# bump when the layout of the delta files changes, old ones are then rebuilt
+FORMAT_VERSION = 1
+# shape keys of morphs whose value is closer to zero are muted
+ZERO_VALUE = 0.0001
+
+_stores = {}  # Morphs directory -> DeltaStore
+
+
+class DeltaStore:
+    """sparse deltas of the morphs below a Morphs directory, i.e. of one figure.
+    the deltas of all morphs are appended to one sidecar file in the cache directory as float32 rows of
+    [vertex index, x, y, z] in blender coordinates, an index (json) holds the rows of each morph and the
+    mtime and size of its dsf file. the rows are memory-mapped, so only the deltas of morphs that are
+    actually shown are read. without cache directory the deltas are read from the dsf files.
+    rows of morphs whose dsf file changed are not reused, they stay in the data file until it is deleted.
+    """
+
+    def __init__(self, dir):
+        self.dir = dir
+        self.entries = {}  # "relative path|morph id" -> [first row, row count, mtime, size]
+        self.rows = None   # memory-mapped rows of the data file
+        self.changed = False
+        name = hashlib.sha1(dir.encode("utf-8")).hexdigest()
+        self.index_file = disk_cache.cache_path(name + ".deltas.json")
+        self.data_file = disk_cache.cache_path(name + ".deltas.bin")
+
+    def load(self):
+        if not os.path.exists(self.index_file) or not os.path.exists(self.data_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            log.error("could not read delta index %s: %s" % (self.index_file, e))
+            return
+        if data.get("version", None) == FORMAT_VERSION:
+            self.entries = data["entries"]
+
+    def save(self):
+        if not self.changed:
+            return
+        self.changed = False
+        data = {"version": FORMAT_VERSION, "dir": self.dir, "entries": self.entries}
+        tmp_file = "%s.%d.tmp" % (self.index_file, os.getpid())
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.index_file)
+        except Exception as e:
+            log.error("could not write delta index %s: %s" % (self.index_file, e))
+
+    def key(self, filepath, morph_id):
+        return "%s|%s" % (os.path.relpath(filepath, self.dir), morph_id)
+
+    def get(self, filepath, morph_id):
+        """the rows of a morph, None if they are not stored or the dsf file changed since"""
+        entry = self.entries.get(self.key(filepath, morph_id), None)
+        if entry is None:
+            return None
+        first, count, mtime, size = entry
+        stat = os.stat(filepath)
+        if stat.st_mtime != mtime or stat.st_size != size:
+            return None
+        if count == 0:
+            return numpy.zeros((0, 4), dtype=numpy.float32)
+        if self.rows is None or len(self.rows) < first + count:
+            # the data file grew since it was mapped
+            row_count = os.path.getsize(self.data_file) // 16
+            self.rows = numpy.memmap(self.data_file, dtype=numpy.float32, mode='r', shape=(row_count, 4))
+        return self.rows[first:first + count]
+
+    def add(self, filepath, morph_id, rows):
+        stat = os.stat(filepath)
+        try:
+            with open(self.data_file, 'ab') as f:
+                f.seek(0, os.SEEK_END)
+                first = f.tell() // 16
+                f.write(numpy.ascontiguousarray(rows, dtype=numpy.float32).tobytes())
+        except Exception as e:
+            log.error("could not write delta file %s: %s" % (self.data_file, e))
+            return
+        self.entries[self.key(filepath, morph_id)] = [first, len(rows), stat.st_mtime, stat.st_size]
+        self.changed = True
+
+
+def read_deltas(filepath, morph_id):
+    """rows of [vertex index, x, y, z] of a morph read from its dsf file, in blender coordinates"""
+    asset = types.get_asset(filepath, sections=["modifier_library"])
+    modifier = asset.modifier_library.find(morph_id)
+    if modifier is None or modifier.morph is None:
+        return numpy.zeros((0, 4), dtype=numpy.float32)
+    morph = modifier.morph
+    rows = numpy.empty((len(morph.vertex_indices), 4), dtype=numpy.float32)
+    rows[:, 0] = morph.vertex_indices
+    rows[:, 1:] = morph.vertex_deltas
+    return rows
+
+
+def get_store(filepath):
+    """the DeltaStore of the figure a morph file belongs to, None if no cache directory is configured"""
+    if not disk_cache.is_enabled():
+        return None
+    dir = find_morphs_dir(filepath)
+    store = _stores.get(dir, None)
+    if store is None:
+        store = DeltaStore(dir)
+        store.load()
+        _stores[dir] = store
+    return store
+
+
+def find_morphs_dir(filepath):
+    """the Morphs directory of the figure a morph file belongs to, derived from the path alone so that
+    the same figure always uses the same store. the directory of the file if it is not below a Morphs directory.
+    """
+    filepath = os.path.normcase(os.path.realpath(filepath))
+    dir = os.path.dirname(filepath)
+    while os.path.basename(dir).lower() != "morphs":
+        parent = os.path.dirname(dir)
+        if parent == dir:
+            return os.path.dirname(filepath)
+        dir = parent
+    return dir
+
+
+def get_deltas(filepath, morph_id):
+    """vertex indices and deltas of a morph, empty if the morph has no deltas"""
+    store = get_store(filepath)
+    rows = store.get(filepath, morph_id) if store is not None else None
+    if rows is None:
+        rows = read_deltas(filepath, morph_id)
+        if store is not None:
+            store.add(filepath, morph_id, rows)
+    return rows[:, 0].astype(numpy.int64), rows[:, 1:]
+
+
+def set_shape_key_value(bl_obj, morph_id, filepath, value):
+    """shape keys are created from the stored deltas when their morph becomes nonzero for the first time.
+    when it returns to zero the key is muted, so blender skips it, and unmuted when it becomes nonzero again.
+    keys are never deleted, they may carry keyframes or drivers.
+    """
+    shape_key = find_shape_key(bl_obj, morph_id)
+    if abs(value) < ZERO_VALUE:
+        if shape_key is not None:
+            shape_key.value = 0.0
+            shape_key.mute = True
+        return
+    if shape_key is None:
+        shape_key = create_shapekey(bl_obj, morph_id, filepath)
+    if shape_key is not None:
+        shape_key.mute = False
+        shape_key.value = value
+
+
+def create_shapekey(bl_obj, morph_id, filepath, base_coords=None):
+    """create the shape key of a morph, None if the morph has no deltas.
+    base_coords: coordinates of the base shape key as returned by get_base_coords, pass them in
+    when creating many shape keys for the same object
+    """
+    if len(filepath) == 0:
+        return None
+    indices, deltas = get_deltas(filepath, morph_id)
+    if len(indices) == 0:
+        return None
+    if base_coords is None:
+        base_coords = get_base_coords(bl_obj)
+    log.debug("creating shape key %s with %d deltas" % (morph_id, len(indices)))
+
+    in_range = indices < len(base_coords)
+    if not in_range.all():
+        log.error("morph %s has deltas for vertices that %s does not have" % (morph_id, bl_obj.name))
+        indices = indices[in_range]
+        deltas = deltas[in_range]
+
+    shape_key = bl_obj.shape_key_add(name=morph_id, from_mix=False)
+    coords = base_coords.copy()
+    # add the deltas to their respective shape-key coordinates.
+    numpy.add.at(coords, indices, deltas)
+    shape_key.data.foreach_set("co", coords.ravel())
+    return shape_key
+
+
+def find_shape_key(bl_obj, morph_id):
+    if bl_obj.data.shape_keys is None:
+        return None
+    return bl_obj.data.shape_keys.key_blocks.get(morph_id, None)
+
+
+def get_base_coords(obj):
+    """return the coordinates of the base shape key as (N, 3) array"""
+    base_shape_key = get_base_shape_key(obj)
+    coords = numpy.empty(len(base_shape_key.data) * 3, dtype=numpy.float32)
+    base_shape_key.data.foreach_get("co", coords)
+    return coords.reshape(-1, 3)
+
+
+def get_base_shape_key(obj):
+    """get or create the base shapekey for object.
+    """
+    if obj.data.shape_keys is None:
+        base_shape_key = obj.shape_key_add('base')
+    else:
+        base_shape_key = obj.data.shape_keys.reference_key
+    return base_shape_key
+
+
+def save_all():
+    """write the indices of the stores that got new morphs"""
+    for store in _stores.values():
+        store.save()
+
+
+def clear():
+    save_all()
+    _stores.clear()
@@ -0,0 +1,399 @@
+import json
+import logging
+from math import pi
+
+import bpy
+
+from . import morph_deltas
+from . import morph_graph
+from . import morph_store
+from . import pose_import
+
+log = logging.getLogger(__name__)
+
+# python operators of the formula operations, the first operand is the top of the stack
+OPERATORS = {"add": "+", "sub": "-", "mult": "*", "div": "/"}
+# DSON bone channels -> (blender property, scale, offset) applied to the combined formula value
+POSE_CHANNELS = {
+    "rotation": ("rotation_euler", pi / 180, 0.0),
+    "translation": ("location", 0.01, 0.0),
+    "scale": ("scale", 1.0, 1.0)
+}
+AXES = {"x": (1, 0, 0), "y": (0, 1, 0), "z": (0, 0, 1)}
+# driver variable transform type prefixes of the pose bone properties
+TRANSFORM_TYPES = {"rotation_euler": "ROT_", "location": "LOC_", "scale": "SCALE_"}
+
+
+def control_object(bl_obj):
+    """the object that holds the morph properties of bl_obj while drivers are used: its armature if it has one.
+    the bone drivers read them and the mesh already depends on the armature, properties on the mesh itself
+    would make a dependency cycle.
+    """
+    return find_armature(bl_obj) or bl_obj
+
+
+def property_name(bl_obj, morph_id):
+    """custom property of the control object that holds the value of a morph while drivers are used,
+    prefixed as an armature can hold the morphs of several meshes
+    """
+    return "%s:%s" % (property_prefix(bl_obj), morph_id)
+
+
+def property_prefix(bl_obj):
+    # chosen when the drivers are created, so that renaming the mesh does not break them
+    return bl_obj.bdst_morph_prefix or bl_obj.name
+
+
+def property_path(bl_obj, morph_id):
+    return '["%s"]' % property_name(bl_obj, morph_id)
+
+
+def get_morph_property(bl_obj, morph_id):
+    return control_object(bl_obj).get(property_name(bl_obj, morph_id), 0.0)
+
+
+def set_morph_property(bl_obj, morph_id, value):
+    control_object(bl_obj)[property_name(bl_obj, morph_id)] = value
+
+
+def create_drivers(bl_obj):
+    """translate the formulas of the loaded morphs of bl_obj into drivers.
+    every morph value becomes a custom property of the control object, see control_object. driven morphs,
+    the shape keys and the pose bone channels of the armature follow these properties in Blender's
+    dependency graph, so they update during animation playback and rendering without running the add-on.
+    rest pose outputs (center_point, end_point, orientation) cannot be driven, they are still applied
+    when a value is set through the add-on.
+    """
+    remove_drivers(bl_obj)
+    bl_obj.bdst_morph_prefix = bl_obj.name
+    graph = morph_graph.get_graph(bl_obj)
+    control = control_object(bl_obj)
+    for bl_morph in bl_obj.bdst_morphs:
+        set_morph_property(bl_obj, bl_morph.name, bl_morph.get("value", 0.0))
+
+    driven = []  # [owner, data path, index] of the created drivers, see find_driver_owner
+
+    def drive(owner, bl_id, data_path, index, formulas, scale=1.0, offset=0.0):
+        if add_driver(bl_obj, bl_id, data_path, index, graph, formulas, scale, offset) > 0:
+            driven.append([owner, data_path, max(index, 0)])
+
+    # driven morphs in evaluation order, so chains are up to date after one pass
+    for i in sorted(graph.incoming, key=lambda i: graph.levels[i]):
+        drive("control", control, property_path(bl_obj, graph.names[i]), -1, graph.incoming[i])
+
+    self_formulas = {}
+    for formula in graph.formulas:
+        if formula.target == formula.owner:
+            self_formulas[formula.owner] = formula
+    create_shape_keys(bl_obj, graph)
+    shape_keys = get_shape_keys(bl_obj)
+    if shape_keys is not None:
+        for i, name in enumerate(graph.names):
+            if name not in shape_keys.key_blocks:
+                continue
+            # formula references containing morph change only the shape key
+            formula = self_formulas.get(i, None) or pass_through(i)
+            drive("shape_keys", shape_keys, 'key_blocks["%s"].value' % name, -1, [formula])
+
+    bl_armature = find_armature(bl_obj)
+    for output, formulas in graph.property_formulas.items():
+        asset_id, path = morph_graph.parse_uri(output)
+        transform = path.split("/")[0]
+        if transform not in POSE_CHANNELS:
+            continue
+        if bl_armature is None:
+            log.warning("%s has no armature for %s" % (bl_obj.name, output))
+            continue
+        bone, pose_bone = pose_import.find_bone_and_pose_bone(bl_armature, asset_id)
+        if bone is None:
+            log.error("bone not found %s" % asset_id)
+            continue
+        prop, scale, offset = POSE_CHANNELS[transform]
+        data_path = 'pose.bones["%s"].%s' % (pose_bone.name, prop)
+        for index, sign in pose_channels(bone, path.split("/")[-1]):
+            drive("armature", bl_armature, data_path, index, formulas, sign * scale, offset)
+
+    # drivers that only read bone channels cannot be told apart from the user's own drivers later
+    bl_obj.bdst_morph_driver_paths = json.dumps(driven)
+    bl_obj.bdst_morph_drivers = True
+    log.debug("created %d morph drivers for %s" % (len(driven), bl_obj.name))
+
+
+def create_shape_keys(bl_obj, graph):
+    """drivers need the shape keys of all loaded morphs, also of those that are zero right now"""
+    if bl_obj.type != 'MESH':
+        return
+    store = morph_store.get_store(bl_obj)
+    base_coords = None
+    for name in graph.names:
+        if not store.is_loaded(name) or morph_deltas.find_shape_key(bl_obj, name) is not None:
+            continue
+        if base_coords is None:
+            base_coords = morph_deltas.get_base_coords(bl_obj)
+        morph_deltas.create_shapekey(bl_obj, name, store.filepath(name), base_coords)
+
+
+def remove_drivers(bl_obj):
+    """remove the drivers created by create_drivers, the morphs keep their current values"""
+    control = control_object(bl_obj)
+    if len(bl_obj.bdst_morph_driver_paths) > 0:
+        for owner, data_path, index in json.loads(bl_obj.bdst_morph_driver_paths):
+            bl_id = find_driver_owner(bl_obj, owner)
+            if bl_id is None or bl_id.animation_data is None:
+                continue
+            drivers = bl_id.animation_data.drivers
+            for fcurve in [fc for fc in drivers if fc.data_path == data_path and fc.array_index == index]:
+                drivers.remove(fcurve)
+    else:
+        # drivers of files from before the driven paths were recorded
+        bl_ids = [bl_obj, get_shape_keys(bl_obj)] + ([control] if control != bl_obj else [])
+        for bl_id in bl_ids:
+            if bl_id is None or bl_id.animation_data is None:
+                continue
+            drivers = bl_id.animation_data.drivers
+            for fcurve in [fc for fc in drivers if is_morph_driver(fc, bl_obj)]:
+                drivers.remove(fcurve)
+    bl_obj.bdst_morph_driver_paths = ""
+
+    for bl_morph in bl_obj.bdst_morphs:
+        name = property_name(bl_obj, bl_morph.name)
+        if name in control:
+            bl_morph["value"] = control[name]
+            del control[name]
+    bl_obj.bdst_morph_drivers = False
+
+
+def find_driver_owner(bl_obj, owner):
+    """the ID a driver recorded by create_drivers belongs to"""
+    if owner == "control":
+        return control_object(bl_obj)
+    if owner == "shape_keys":
+        return get_shape_keys(bl_obj)
+    return find_armature(bl_obj)
+
+
+def is_morph_driver(fcurve, bl_obj):
+    """drivers of the morph properties and shape keys of bl_obj and drivers that read its morph properties"""
+    prefix = '["%s:' % property_prefix(bl_obj)
+    path = fcurve.data_path
+    if path.startswith(prefix):
+        return True
+    if path.startswith('key_blocks["') and path[len('key_blocks["'):].split('"]')[0] in bl_obj.bdst_morphs:
+        return True
+    control = control_object(bl_obj)
+    for variable in fcurve.driver.variables:
+        target = variable.targets[0]
+        if target.id == control and target.data_path.startswith(prefix):
+            return True
+    return False
+
+
+def add_driver(bl_obj, bl_id, data_path, index, graph, formulas, scale=1.0, offset=0.0):
+    """drive a property with the combined value of formulas, scaled and offset for bone channels.
+    returns the number of created drivers, properties that do not depend on any morph are not driven.
+    """
+    inputs = sorted(set().union(*[read_inputs(f) for f in formulas]))
+    bl_armature = find_armature(bl_obj)
+    channels = {}
+    for i in inputs:
+        if i >= graph.morph_count and bl_armature is not None:
+            channels[i] = input_channel(bl_armature, *graph.bone_inputs[i - graph.morph_count])
+    # bone channels that cannot be read stay unresolved, as in the morph graph
+    inputs = [i for i in inputs if i < graph.morph_count or channels.get(i, None) is not None]
+    if len(inputs) == 0:
+        return 0
+
+    fcurve = bl_id.driver_add(data_path, index) if index >= 0 else bl_id.driver_add(data_path)
+    driver = fcurve.driver
+    variable_of = {}
+    factors = {}
+    for n, i in enumerate(inputs):
+        variable = driver.variables.new()
+        variable.name = "v%d" % n
+        if i < graph.morph_count:
+            variable.type = 'SINGLE_PROP'
+            variable.targets[0].id = control_object(bl_obj)
+            variable.targets[0].data_path = property_path(bl_obj, graph.names[i])
+            factors[i] = 1.0
+            variable_of[i] = variable.name
+        else:
+            bone_name, prop, channel, factor = channels[i]
+            variable.type = 'TRANSFORMS'
+            variable.targets[0].id = bl_armature
+            variable.targets[0].bone_target = bone_name
+            variable.targets[0].transform_type = TRANSFORM_TYPES[prop] + "XYZ"[channel]
+            variable.targets[0].transform_space = 'LOCAL_SPACE'
+            factors[i] = factor
+            variable_of[i] = "(%s * %r)" % (variable.name, factor)
+
+    # linear outputs that weight all inputs the same need no python: the sum of the variables
+    # is mapped by the polynomial of the generator modifier
+    affine = combine_affine(formulas, factors)
+    coefficients = set(affine[1].values()) if affine is not None else set()
+    if affine is not None and len(coefficients) == 1 and set(affine[1]) == set(inputs):
+        driver.type = 'SUM'
+        set_generator(fcurve, affine[0] * scale + offset, coefficients.pop() * scale)
+    elif affine is not None:
+        driver.type = 'SCRIPTED'
+        terms = ["%r * v%d" % (affine[1][i] * scale, n) for n, i in enumerate(inputs) if i in affine[1]]
+        driver.expression = " + ".join(["%r" % (affine[0] * scale + offset)] + terms)
+        set_generator(fcurve, 0.0, 1.0)
+    else:
+        driver.type = 'SCRIPTED'
+        driver.expression = "%s * %r + %r" % (combined_expression(formulas, variable_of), scale, offset)
+        set_generator(fcurve, 0.0, 1.0)
+    return 1
+
+
+def pass_through(i):
+    """formula that passes the value of a morph on unchanged"""
+    return morph_graph.GraphFormula(i, i, "", "sum", [("push", 0.0, i, "")])
+
+
+def read_inputs(formula):
+    """the morphs whose values the formula pushes"""
+    return {op[2] for op in formula.operations if op[2] is not None}
+
+
+def set_generator(fcurve, constant, factor):
+    """map the driver value x to constant + factor * x"""
+    generator = None
+    for modifier in fcurve.modifiers:
+        if modifier.type == 'GENERATOR':
+            generator = modifier
+    if generator is None:
+        generator = fcurve.modifiers.new('GENERATOR')
+    generator.mode = 'POLYNOMIAL'
+    generator.use_additive = False
+    generator.poly_order = 1
+    generator.coefficients = (constant, factor)
+
+
+def combine_affine(formulas, factors):
+    """affine form of the combined value of formulas that only add linear terms, otherwise None.
+    the coefficients are multiplied with the factors from driver variable to input value, inputs without
+    factor are unresolved and add UNRESOLVED_VALUE * coefficient to the constant.
+    """
+    constant = 0.0
+    terms = {}
+    for formula in formulas:
+        if formula.stage != "sum" or formula.affine is None:
+            return None
+        constant += formula.affine[0]
+        for i, coefficient in formula.affine[1].items():
+            if i not in factors:
+                constant += morph_graph.UNRESOLVED_VALUE * coefficient
+            else:
+                terms[i] = terms.get(i, 0.0) + coefficient * factors[i]
+    return constant, terms
+
+
+def combined_expression(formulas, variable_of):
+    """python expression of the combined value of formulas, see morph_graph.combine"""
+    sums = [formula_expression(f, variable_of) for f in formulas if f.stage == "sum"]
+    factors = [formula_expression(f, variable_of) for f in formulas if f.stage != "sum"]
+    if len(sums) > 0:
+        factors.insert(0, "(%s)" % " + ".join(sums))
+    return " * ".join(factors) if len(factors) > 0 else "0.0"
+
+
+def formula_expression(formula, variable_of):
+    stack = []
+    for op, val, input, url in formula.operations:
+        if op == "push":
+            if input in variable_of:
+                stack.append(variable_of[input])
+            elif len(url) > 0:
+                stack.append("%r" % morph_graph.UNRESOLVED_VALUE)
+            else:
+                stack.append("%r" % val)
+        else:
+            a = stack.pop()
+            b = stack.pop()
+            stack.append("(%s %s %s)" % (a, OPERATORS[op], b))
+    return stack.pop()
+
+
+def input_channel(bl_armature, bone_id, path):
+    """the pose bone channel of a DSON bone input as (pose bone name, property, channel index, factor),
+    the DSON value is factor * channel value. path is the property path of the input url, e.g. rotation/x/value.
+    None if the armature does not have the bone or the transform or axis is unknown.
+    """
+    parts = path.split("/")
+    if len(parts) < 2 or parts[0] not in POSE_CHANNELS or (parts[1] not in AXES and parts[1] != "general"):
+        return None
+    bone, pose_bone = pose_import.find_bone_and_pose_bone(bl_armature, bone_id)
+    if bone is None:
+        return None
+    prop, scale, offset = POSE_CHANNELS[parts[0]]
+    channels = pose_channels(bone, parts[1])
+    if len(channels) == 0:
+        return None
+    index, sign = channels[0]
+    return pose_bone.name, prop, index, sign / scale
+
+
+def pose_channels(bone, axis):
+    """(channel index, sign) of the blender channels a DSON axis maps to, see pose_import.transform_bone_orientation"""
+    axes = ["x", "y", "z"] if axis == "general" else [axis]
+    channels = []
+    for axis in axes:
+        mapped = pose_import.transform_bone_orientation(bone, *AXES[axis])
+        for index, value in enumerate(mapped):
+            if value != 0:
+                channels.append((index, value))
+    return channels
+
+
+def get_shape_keys(bl_obj):
+    return bl_obj.data.shape_keys if bl_obj.type == 'MESH' else None
+
+
+def find_armature(bl_obj):
+    parent = bl_obj
+    while parent is not None and parent.type != 'ARMATURE':
+        parent = parent.parent
+    return parent
+
+
+class MorphDriverCreator(bpy.types.Operator):
+    bl_label = "create morph drivers"
+    bl_idname = "bdst.create_morph_drivers"
+    bl_description = "Drive shape keys and bones of the active object by its morph values with Blender drivers"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and len(context.active_object.bdst_morphs) > 0
+
+    def execute(self, context):
+        create_drivers(context.active_object)
+        return {"FINISHED"}
+
+
+class MorphDriverRemover(bpy.types.Operator):
+    bl_label = "remove morph drivers"
+    bl_idname = "bdst.remove_morph_drivers"
+    bl_description = "Remove the morph drivers of the active object, morphs are applied by the add-on again"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.bdst_morph_drivers
+
+    def execute(self, context):
+        remove_drivers(context.active_object)
+        return {"FINISHED"}
+
+
+def register():
+    bpy.utils.register_class(MorphDriverCreator)
+    bpy.utils.register_class(MorphDriverRemover)
+    bpy.types.Object.bdst_morph_drivers = bpy.props.BoolProperty(name="morphs use drivers")
+    bpy.types.Object.bdst_morph_prefix = bpy.props.StringProperty(name="morph property prefix")
+    bpy.types.Object.bdst_morph_driver_paths = bpy.props.StringProperty(name="morph driver paths")
+
+
+def unregister():
+    bpy.utils.unregister_class(MorphDriverCreator)
+    bpy.utils.unregister_class(MorphDriverRemover)
@@ -0,0 +1,348 @@
+import heapq
+import logging
+from collections import defaultdict, OrderedDict
+from functools import lru_cache
+
+import numpy
+
+from . import morph_store
+from .types.modifier import BONE_INPUT_TRANSFORMS
+from .types.util import Uri
+
+log = logging.getLogger(__name__)
+
+# the first operand is the top of the stack
+ARITHMETIC = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mult": lambda a, b: a * b,
+    "div": lambda a, b: a / b
+}
+# pushed for urls that do not reference a morph or bone channel
+# TODO nodes
+UNRESOLVED_VALUE = -1.99
+
+_graphs = {}  # cache key, see morph_store.cache_key -> MorphGraph
+
+
+@lru_cache(maxsize=None)
+def parse_uri(url):
+    """asset id and property path of a formula url, every url is parsed only once per session"""
+    uri = Uri(url)
+    return uri.asset_id, uri.property_path
+
+
+class GraphFormula:
+    """a formula of a morph with its urls resolved to morph indices.
+    linear formulas (pushes of values and constants combined with add, sub and mult or div by constants)
+    are compiled to constant + coefficients * input values, see compile_affine. the others are interpreted.
+    """
+    def __init__(self, owner, target, output, stage, operations):
+        self.owner = owner    # index of the morph the formula is stored on
+        self.target = target  # index of the output morph, None if the output is another property
+        self.output = output
+        self.stage = stage
+        self.operations = operations  # (op, val, input morph index or None, url)
+        self.inputs = {owner} | {op[2] for op in operations if op[2] is not None}
+        self.affine = compile_affine(operations)  # (constant, {input: coefficient}) or None
+
+    def evaluate(self, value_of):
+        """interpret the operations, the fallback for formulas that are not linear"""
+        stack = []
+        for op, val, input, url in self.operations:
+            if op == "push":
+                if input is not None:
+                    val = value_of(input)
+                elif len(url) > 0:
+                    val = UNRESOLVED_VALUE
+                stack.append(val)
+            else:
+                a = stack.pop()
+                b = stack.pop()
+                stack.append(ARITHMETIC[op](a, b))
+        return stack.pop()
+
+
+def compile_affine(operations):
+    """run the operations on affine expressions (constant, {morph index: coefficient}) instead of numbers.
+    returns the expression of the result or None if the formula is not linear in the morph values.
+    """
+    stack = []
+    for op, val, input, url in operations:
+        if op == "push":
+            if input is not None:
+                stack.append((0.0, {input: 1.0}))
+            elif len(url) > 0:
+                stack.append((UNRESOLVED_VALUE, {}))
+            else:
+                stack.append((val, {}))
+            continue
+        if len(stack) < 2:
+            return None
+        a = stack.pop()
+        b = stack.pop()
+        if op == "add" or op == "sub":
+            sign = 1.0 if op == "add" else -1.0
+            terms = dict(a[1])
+            for i, coefficient in b[1].items():
+                terms[i] = terms.get(i, 0.0) + sign * coefficient
+            stack.append((a[0] + sign * b[0], terms))
+        elif op == "mult" and len(a[1]) == 0:
+            stack.append(scale_affine(b, a[0]))
+        elif op == "mult" and len(b[1]) == 0:
+            stack.append(scale_affine(a, b[0]))
+        elif op == "div" and len(b[1]) == 0 and b[0] != 0:
+            stack.append(scale_affine(a, 1.0 / b[0]))
+        else:
+            return None
+    if len(stack) != 1:
+        return None
+    return stack[0]
+
+
+def scale_affine(affine, factor):
+    return affine[0] * factor, {i: coefficient * factor for i, coefficient in affine[1].items()}
+
+
+class MorphGraph:
+    """dependencies between the morphs of an object: morph -> formula -> output morph or property.
+    a formula depends on the morph it is stored on and on the morphs it reads. morphs are evaluated in
+    topological order, level by level, so a change evaluates every affected formula and morph only once.
+    the linear formulas form a sparse matrix (csr: row_starts, columns, coefficients) from morph values to
+    formula results plus constants, the formulas feeding one level are evaluated with one mat-vec.
+    """
+    def __init__(self, bl_obj):
+        morphs = bl_obj.bdst_morphs
+        self.morph_count = len(morphs)
+        self.names = [bl_morph.name for bl_morph in morphs]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.formulas = []
+        self.dependents = defaultdict(list)  # morph index -> formulas to evaluate when it changes
+        self.incoming = defaultdict(list)    # morph index -> formulas with the morph as output
+        self.property_formulas = defaultdict(list)  # output url -> formulas
+        # bone channels read by formulas, (bone id, property path). they are inputs after the morphs,
+        # bone input k has the index morph_count + k
+        self.bone_inputs = []
+        self.bone_input_index = {}
+
+        store = morph_store.get_store(bl_obj)
+        for owner, name in enumerate(self.names):
+            for output, stage, stored_operations in store.get_formulas(name):
+                operations = []
+                for op, val, url in stored_operations:
+                    input = self.resolve_input(url) if len(url) > 0 else None
+                    operations.append((op, val, input, url))
+                target = self.index.get(parse_uri(output)[0], None)
+                formula = GraphFormula(owner, target, output, stage, operations)
+                formula.id = len(self.formulas)
+                self.formulas.append(formula)
+                for input in formula.inputs:
+                    self.dependents[input].append(formula)
+                if target is None:
+                    self.property_formulas[output].append(formula)
+                elif target != owner:
+                    self.incoming[target].append(formula)
+
+        self.build_matrix()
+        self.levels = self.topological_levels()
+
+    def resolve_input(self, url):
+        """index of the morph or bone channel url refers to, None if it is neither"""
+        asset_id, property_path = parse_uri(url)
+        if asset_id in self.index:
+            return self.index[asset_id]
+        if property_path.split("/")[0] not in BONE_INPUT_TRANSFORMS:
+            return None
+        key = (asset_id, property_path)
+        if key not in self.bone_input_index:
+            self.bone_input_index[key] = self.morph_count + len(self.bone_inputs)
+            self.bone_inputs.append(key)
+        return self.bone_input_index[key]
+
+    def input_count(self):
+        return self.morph_count + len(self.bone_inputs)
+
+    def build_matrix(self):
+        row_lengths = numpy.zeros(len(self.formulas), dtype=numpy.int64)
+        columns = []
+        coefficients = []
+        self.constants = numpy.zeros(len(self.formulas))
+        self.is_linear = numpy.zeros(len(self.formulas), dtype=bool)
+        for formula in self.formulas:
+            if formula.affine is None:
+                continue
+            constant, terms = formula.affine
+            self.constants[formula.id] = constant
+            self.is_linear[formula.id] = True
+            row_lengths[formula.id] = len(terms)
+            columns.extend(terms.keys())
+            coefficients.extend(terms.values())
+        self.row_starts = numpy.concatenate(([0], numpy.cumsum(row_lengths)))
+        self.columns = numpy.array(columns, dtype=numpy.int64)
+        self.coefficients = numpy.array(coefficients, dtype=numpy.float64)
+        log.debug("morph graph: %d of %d formulas are linear" % (numpy.count_nonzero(self.is_linear), len(self.formulas)))
+
+    def topological_levels(self):
+        """level of each input: 0 for bone channels and morphs without formula inputs, otherwise one more
+        than the highest level of its inputs. morphs in cycles are placed after all others.
+        """
+        successors = defaultdict(set)
+        input_count = self.input_count()
+        in_degree = [0] * input_count
+        for formula in self.formulas:
+            if formula.target is None or formula.target == formula.owner:
+                continue
+            for input in formula.inputs:
+                if input != formula.target and formula.target not in successors[input]:
+                    successors[input].add(formula.target)
+                    in_degree[formula.target] += 1
+
+        levels = [0] * input_count
+        done = [False] * input_count
+        ready = [i for i in range(input_count) if in_degree[i] == 0]
+        max_level = 0
+        while len(ready) > 0:
+            i = ready.pop()
+            done[i] = True
+            max_level = max(max_level, levels[i])
+            for successor in successors[i]:
+                levels[successor] = max(levels[successor], levels[i] + 1)
+                in_degree[successor] -= 1
+                if in_degree[successor] == 0:
+                    ready.append(successor)
+        for i in range(self.morph_count):
+            if not done[i]:
+                log.warning("morph %s is part of a formula cycle" % self.names[i])
+                max_level += 1
+                levels[i] = max_level
+        return levels
+
+    def evaluate(self, formulas, value_of):
+        """results of the formulas, the linear ones with one sparse mat-vec"""
+        results = numpy.zeros(len(formulas))
+        if len(formulas) == 0:
+            return results
+        ids = numpy.array([f.id for f in formulas], dtype=numpy.int64)
+        linear = self.is_linear[ids]
+
+        rows = ids[linear]
+        starts = self.row_starts[rows]
+        lengths = self.row_starts[rows + 1] - starts
+        # entry positions of all rows: the start of its row plus the position within the row
+        entries = numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths) + numpy.arange(lengths.sum())
+        columns = self.columns[entries]
+        unique_columns, column_positions = numpy.unique(columns, return_inverse=True)
+        values = numpy.array([value_of(i) for i in unique_columns.tolist()], dtype=numpy.float64)
+        products = self.coefficients[entries] * values[column_positions]
+        row_of_entry = numpy.repeat(numpy.arange(len(rows)), lengths)
+        results[linear] = self.constants[rows] + numpy.bincount(row_of_entry, weights=products, minlength=len(rows))
+
+        for position in numpy.nonzero(~linear)[0].tolist():
+            results[position] = formulas[position].evaluate(value_of)
+        return results
+
+    def combine_outputs(self, formulas, value_of):
+        """combined value of formulas that share an output"""
+        results = self.evaluate(formulas, value_of)
+        return combine(zip([f.stage for f in formulas], results.tolist()))
+
+    def propagate(self, sources, value_of):
+        """evaluate everything that depends on the inputs (morphs or bone channels) with the indices in sources,
+        all at once. value_of returns the current value of an input by index.
+        returns the new values of the driven morphs (index -> value, in evaluation order), the shape key values
+        of formulas with their own morph as output (index -> value) and the combined values of the changed
+        properties (output url -> value).
+        """
+        morph_values = OrderedDict()
+        changed_properties = []
+        self_formulas = []
+        value_cache = {}
+
+        def current_value(i):
+            if i in morph_values:
+                return morph_values[i]
+            if i not in value_cache:
+                value_cache[i] = value_of(i)
+            return value_cache[i]
+
+        pending = defaultdict(list)  # level -> morphs to evaluate
+        queued = set(sources)
+        level_heap = []
+
+        def mark_dependents(i):
+            for formula in self.dependents[i]:
+                if formula.target is None:
+                    if formula.output not in changed_properties:
+                        changed_properties.append(formula.output)
+                elif formula.target == formula.owner:
+                    if formula not in self_formulas:
+                        self_formulas.append(formula)
+                elif formula.target not in queued:
+                    queued.add(formula.target)
+                    level = self.levels[formula.target]
+                    if level not in pending:
+                        heapq.heappush(level_heap, level)
+                    pending[level].append(formula.target)
+
+        for i in sources:
+            mark_dependents(i)
+        while len(level_heap) > 0:
+            level = heapq.heappop(level_heap)
+            targets = pending.pop(level)
+            formulas = [f for i in targets for f in self.incoming[i]]
+            results = self.evaluate(formulas, current_value).tolist()
+            position = 0
+            for i in targets:
+                count = len(self.incoming[i])
+                value = combine(zip([f.stage for f in self.incoming[i]], results[position:position + count]))
+                position += count
+                if abs(value - current_value(i)) <= 0.001:
+                    # unchanged, nothing downstream needs to be evaluated
+                    continue
+                morph_values[i] = value
+                mark_dependents(i)
+
+        shape_key_values = OrderedDict()
+        # formula references containing morph, change only shape key
+        for formula, value in zip(self_formulas, self.evaluate(self_formulas, current_value).tolist()):
+            shape_key_values[formula.owner] = value
+
+        property_values = OrderedDict()
+        for output in changed_properties:
+            property_values[output] = self.combine_outputs(self.property_formulas[output], current_value)
+        return morph_values, shape_key_values, property_values
+
+
+def combine(stage_values):
+    """combine the results of all formulas with the same output, "sum" results are added,
+    the others ("mult") multiply the sum
+    """
+    total = None
+    factors = []
+    for stage, value in stage_values:
+        if stage == "sum":
+            total = value if total is None else total + value
+        else:
+            factors.append(value)
+    for factor in factors:
+        total = factor if total is None else total * factor
+    return total if total is not None else 0.0
+
+
+def get_graph(bl_obj):
+    """the cached graph of the object, rebuilt if morphs were added"""
+    key = morph_store.cache_key(bl_obj)
+    graph = _graphs.get(key, None)
+    if graph is None or graph.morph_count != len(bl_obj.bdst_morphs):
+        graph = MorphGraph(bl_obj)
+        _graphs[key] = graph
+    return graph
+
+
+def invalidate(bl_obj):
+    """call after the formulas of an object changed"""
+    _graphs.pop(morph_store.cache_key(bl_obj), None)
+
+
+def clear():
+    _graphs.clear()
@@ -1,4 +1,4 @@
-import fnmatch
+import json
 import logging
 import os
 import time
@@ -6,17 +6,28 @@ from collections import OrderedDict
 from functools import partial
 
 import bpy
-from mathutils import Vector
+from bpy.app.handlers import persistent
 
 from bpy.props import BoolProperty, StringProperty, FloatProperty
 
-from .types.util import Uri
+from .types import morph_manifest
+from .types.modifier import formula_tuples
+from .decode_pool import parallel_read_all_morph_infos
 from . import types
 from . import pose_import
 from . import armature
+from . import morph_graph
+from . import morph_drivers
+from . import corrective_morphs
+from . import morph_store
+from . import morph_deltas
+from .transaction import ImportTransaction
 
 log = logging.getLogger(__name__)
 
+POSE_TRANSFORMS = ["rotation", "translation", "scale"]
+EDIT_TRANSFORMS = ["center_point", "end_point", "orientation"]
+
 
 def load_morph(filepath, context):
     start_time = time.time()
@@ -29,11 +40,9 @@ def load_morph(filepath, context):
             if os.path.isfile(abs_file) and f.endswith(".dsf"):
                 files.append(abs_file)
 
-    for file in files:
-        asset = types.Asset(file)
-
-        bl_obj = context.active_object
-        create_morphs(bl_obj, asset)
+    bl_obj = context.active_object
+    for file, infos in parallel_read_all_morph_infos(files):
+        create_morph_stubs(bl_obj, file, infos)
 
     end_time = time.time()
     elapsed_time = end_time - start_time
@@ -46,51 +55,81 @@ def load_all_morphs(dir, bl_obj):
     if not os.path.exists(dir):
         return
 
+    manifest = morph_manifest.get_manifest(dir, parallel_read_all_morph_infos)
     files = []
-    for root, dirnames, filenames in os.walk(dir):
-        for filename in fnmatch.filter(filenames, "*.dsf"):
-            if "CTRLRIG" not in filename:  # no idea what the purpose of CTRLRIG morphs is
-                log.debug("appending morph filename " + filename)
-                files.append(os.path.join(root, filename))
+    for file in manifest.filepaths():
+        if "CTRLRIG" not in os.path.basename(file):  # no idea what the purpose of CTRLRIG morphs is
+            files.append(file)
 
     for file in files:
-        asset = types.Asset(file)
-        log.debug("asset.id " + asset.asset_id)
-        create_morphs(bl_obj, asset)
+        create_morph_stubs(bl_obj, file, manifest.infos(file))
 
     end_time = time.time()
     elapsed_time = end_time - start_time
     log.debug("imported %d morphs in %.3f seconds" % (len(files), elapsed_time))
 
 
-def create_morphs(bl_obj, asset):
-    for key, modifier in asset.modifier_library.modifiers.items():
-        log.debug("modifier %s type=%s" % (modifier.id, modifier.type))
-        if modifier.type == "morph":
-            if modifier.morph is not None:
-                create_shapekey(bl_obj, modifier)
-            bl_morph = bl_obj.bdst_morphs.add()
-            bl_morph.name = modifier.id
-            bl_morph.visible = (not modifier.channel) or modifier.channel.visible
-            for formula in modifier.formulas:
-                # ignore formulas with unknown operations
-                valid = True
-                for operation in formula.operations:
-                    valid = valid and operation.op != "spline_tcb"
-                if not valid:
-                    continue
-
-                bl_formula = bl_morph.formulas.add()
-                bl_formula.output = formula.output
-                bl_formula.stage = formula.stage
-                for operation in formula.operations:
-                    bl_operation = bl_formula.operations.add()
-                    bl_operation.op = operation.op
-                    bl_operation.val = operation.val if operation.val else 0.0
-                    bl_operation.url = operation.url if operation.url else ""
+def create_morph_stubs(bl_obj, filepath, infos):
+    """add the morphs of a dsf file to bl_obj without their shape keys and formulas.
+    these are loaded by load_morph_data when the morph is set to a nonzero value for the first time.
+    infos: the MorphInfos of the file, see types.morph_manifest
+    """
+    store = morph_store.get_store(bl_obj)
+    loaded_formulas = False
+    for info in infos:
+        if store.position(bl_obj, info.id) is not None:
+            continue
+        bl_morph = bl_obj.bdst_morphs.add()
+        bl_morph.name = info.id
+        bl_morph.label = info.label
+        bl_morph.visible = info.visible
+        store.add_morph(info.id, filepath, len(bl_obj.bdst_morphs) - 1)
+        if len(info.bone_inputs) > 0:
+            # corrective morphs are applied by the pose, their formulas have to be known up front.
+            # they come with the MorphInfo, the file is only decoded when the shape key is needed
+            store.set_loaded(info.id, info.formulas)
+            loaded_formulas = True
+    if loaded_formulas:
+        morph_graph.invalidate(bl_obj)
+
+
+def is_loaded(bl_morph):
+    return morph_store.get_store(bl_morph.id_data).is_loaded(bl_morph.name)
+
+
+def load_morph_data(bl_obj, bl_morph):
+    """load the formulas of a morph and the morphs its formulas change"""
+    store = morph_store.get_store(bl_obj)
+    filepath = store.filepath(bl_morph.name)
+    store.set_loaded(bl_morph.name, [])
+    asset = types.get_asset(filepath, sections=["modifier_library"])
+    modifier = asset.modifier_library.find(bl_morph.name)
+    if modifier is None:
+        log.error("morph %s not found in %s" % (bl_morph.name, filepath))
+        return
+    log.debug("loading morph %s from %s" % (modifier.id, filepath))
+
+    # the shape key is created from the delta store when the morph becomes nonzero
+    formulas = create_formulas(modifier)
+    store.set_loaded(bl_morph.name, formulas)
+    morph_graph.invalidate(bl_obj)
+
+    for output, _, _ in formulas:
+        target = find_morph(bl_obj, morph_graph.parse_uri(output)[0])
+        if target is not None and not is_loaded(target):
+            load_morph_data(bl_obj, target)
+
+
+def create_formulas(modifier):
+    """the formulas of a morph modifier as stored in the morph store: [(output, stage, [(op, val, url)])]"""
+    return formula_tuples(modifier.formulas)
 
 
 def get_morph_value(self):
+    bl_obj = self.id_data
+    if bl_obj.bdst_morph_drivers:
+        # the value of driven morphs is only known to the driver
+        return morph_drivers.get_morph_property(bl_obj, self.name)
     if "value" in self:
         return self["value"]
     return 0.0
@@ -100,91 +139,169 @@ def set_morph_value(self, value):
     if "value" not in self or abs(value - self["value"]) > 0.001:
         self["value"] = value
 
-        bl_obj = bpy.context.object
+        bl_obj = self.id_data
         bl_morph = self
         log.debug("setting %s to value %.3f" % (bl_morph.name, value))
-        apply_morph(bl_obj, bl_morph, value, process_outputs=True)
-
-
-def apply_morph(bl_obj, bl_morph, value, process_outputs=True):
-    log.debug("apply morph %s %.3f %s" % (bl_morph.name, value, process_outputs))
-    sk = find_shape_key(bl_obj, bl_morph.name)
-    if sk:
-        sk.value = value
-
-    outputs = []
-    for bl_formula in bl_morph.formulas:
-        stack = []
-        for bl_operation in bl_formula.operations:
-            execute_operation(bl_obj, stack, bl_operation)
-
-        output = bl_formula.output
-        stage = bl_formula.stage
-        value = stack.pop()
-        log.debug("%s: %.3f" %(output, value))
-        outputs.append(FormulaResult(output, stage, value))
-
-    non_morph_outputs = process_morphs(bl_obj, bl_morph, outputs)
-    if process_outputs:
-        process_formula_outputs(bl_obj, bl_morph, non_morph_outputs)
-        return []
-    else:
-        return non_morph_outputs
-
-
-def process_morphs(bl_obj, bl_morph, outputs):
-    """ Recursively process and apply all morphs, return all formulas with a non-morph output """
-    non_morphs = []
-
-    # handle morphs
-    for formula_result in outputs:
-        uri = Uri(formula_result.output)
-        asset_id = uri.asset_id
-        morph = find_morph(bl_obj, asset_id)
-        if morph and morph is not bl_morph:
-            # set value first to avoid endless recursion of bpy property setter
-            morph["value"] = formula_result.value
-            morph.value = formula_result.value
-            non_morphs.extend(apply_morph(bl_obj, morph, formula_result.value, process_outputs=False))
-        elif morph:  # formula references containing morph, change only shape_key
-            sk = find_shape_key(bl_obj, bl_morph.name)
-            if sk:
-                sk.value = formula_result.value
-        else:
-            non_morphs.append(formula_result)
+        with armature.ArmatureEditSession():
+            apply_morphs(bl_obj, [bl_morph])
+        # morphs loaded on first use are written to the object before the undo step
+        morph_store.save(bl_obj)
+        morph_deltas.save_all()
 
-    return non_morphs
 
+def set_morph_values(bl_obj, values):
+    """set several morphs of bl_obj at once, values maps morph ids to values.
+    the formulas are evaluated once for all changes and the bone outputs are applied in one pass.
+    """
+    changed = []
+    for morph_id, value in values.items():
+        bl_morph = find_morph(bl_obj, morph_id)
+        if bl_morph is None:
+            log.error("morph %s not found on %s" % (morph_id, bl_obj.name))
+            continue
+        if "value" not in bl_morph or abs(value - bl_morph["value"]) > 0.001:
+            bl_morph["value"] = value
+            changed.append(bl_morph)
+    with armature.ArmatureEditSession():
+        apply_morphs(bl_obj, changed)
+    morph_store.save(bl_obj)
+    morph_deltas.save_all()
+
+
+def apply_morphs(bl_obj, bl_morphs):
+    """apply the new values of morphs to their shape keys and to everything their formulas drive"""
+    if bl_obj.bdst_morph_drivers:
+        apply_morphs_to_drivers(bl_obj, bl_morphs)
+        return
+    sources = []
+    for bl_morph in bl_morphs:
+        value = bl_morph["value"]
+        log.debug("apply morph %s %.3f" % (bl_morph.name, value))
+        if not is_loaded(bl_morph):
+            if value == 0:
+                # nothing was applied yet, there is nothing to undo
+                continue
+            load_morph_data(bl_obj, bl_morph)
+        set_shape_key_value(bl_obj, bl_morph.name, value)
+        sources.append(bl_morph.name)
+    if len(sources) == 0:
+        return
 
-def process_formula_outputs(bl_obj, bl_morph, outputs):
-    """ All morphs have already been handled by process_morphs, outputs is the final list of all properties
-    that will be transformed / changed here """
+    graph = morph_graph.get_graph(bl_obj)
+    apply_graph(bl_obj, graph, {graph.index[name] for name in sources})
 
-    # combine formula outputs that will change the same property
-    combined = {}
-    for formula_result in outputs:
-        target = formula_result.output
-        if target in combined:
-            partial_result = combined[target]
-            if formula_result.stage == "sum":
-                partial_result.value += formula_result.value
-            else:  # assume 'mult'
-                partial_result.value *= formula_result.value
-        else:
-            combined[target] = formula_result
 
+def apply_graph(bl_obj, graph, sources):
+    """propagate changes of the graph inputs with the indices in sources and apply the results"""
+    morphs = bl_obj.bdst_morphs
+    morph_values, shape_key_values, property_values = graph.propagate(sources, graph_value_of(bl_obj, graph))
+
+    for i, morph_value in morph_values.items():
+        morph = morphs[i]
+        # set the stored value directly, the property setter would propagate again
+        morph["value"] = morph_value
+        if not is_loaded(morph) and morph_value != 0:
+            load_morph_data(bl_obj, morph)
+        set_shape_key_value(bl_obj, morph.name, morph_value)
+    for i, shape_key_value in shape_key_values.items():
+        set_shape_key_value(bl_obj, morphs[i].name, shape_key_value)
+    process_formula_outputs(bl_obj, property_values)
+
+
+def set_shape_key_value(bl_obj, morph_id, value):
+    morph_deltas.set_shape_key_value(bl_obj, morph_id, morph_store.get_store(bl_obj).filepath(morph_id), value)
+
+
+def graph_value_of(bl_obj, graph, morph_value=None):
+    """current values of the inputs of the graph by index, the values of morphs and bone channels.
+    morph_value: value of the morph with an index, the stored morph values by default
+    """
+    morphs = bl_obj.bdst_morphs
+    bone_inputs = []
+
+    def value_of(i):
+        if i < graph.morph_count:
+            return morph_value(i) if morph_value is not None else morphs[i].get("value", 0.0)
+        if len(bone_inputs) == 0:
+            bone_inputs.append(corrective_morphs.get_bone_inputs(bl_obj, graph))
+            bone_inputs[0].read()
+        return bone_inputs[0].value(i)
+    return value_of
+
+
+@persistent
+def update_corrective_morphs(scene):
+    """evaluate the formulas that read bone channels (JCMs etc.) of the bones that moved since the last update"""
+    for bl_obj in scene.objects:
+        if bl_obj.type != 'MESH' or len(bl_obj.bdst_morphs) == 0 or bl_obj.bdst_morph_drivers:
+            # drivers read the bone channels themselves
+            continue
+        graph = morph_graph.get_graph(bl_obj)
+        if len(graph.bone_inputs) == 0:
+            continue
+        changed = corrective_morphs.get_bone_inputs(bl_obj, graph).changed()
+        if len(changed) > 0:
+            log.debug("%s: %d bone inputs changed" % (bl_obj.name, len(changed)))
+            with armature.ArmatureEditSession():
+                apply_graph(bl_obj, graph, set(changed))
+
+
+@persistent
+def clear_morph_caches(dummy):
+    """after loading a file or undo the objects hold the current morph data"""
+    morph_store.clear()
+    morph_deltas.clear()
+    morph_graph.clear()
+    corrective_morphs.clear()
+
+
+@persistent
+def save_morph_stores(dummy):
+    morph_store.save_all()
+    morph_deltas.save_all()
+
+
+def apply_morphs_to_drivers(bl_obj, bl_morphs):
+    """the drivers of bl_obj update the shape keys and pose bones from the morph properties,
+    only morphs that were not loaded yet and the rest pose outputs are handled here
+    """
+    loaded = False
+    for bl_morph in bl_morphs:
+        value = bl_morph["value"]
+        morph_drivers.set_morph_property(bl_obj, bl_morph.name, value)
+        if not is_loaded(bl_morph) and value != 0:
+            load_morph_data(bl_obj, bl_morph)
+            loaded = True
+    if loaded:
+        morph_drivers.create_drivers(bl_obj)
+
+    graph = morph_graph.get_graph(bl_obj)
+    if not any(is_edit_output(output) for output in graph.property_formulas):
+        return
+    names = graph.names
+    _, _, property_values = graph.propagate(
+        {graph.index[bl_morph.name] for bl_morph in bl_morphs},
+        graph_value_of(bl_obj, graph, lambda i: morph_drivers.get_morph_property(bl_obj, names[i])))
+    process_formula_outputs(bl_obj, OrderedDict(
+        (output, value) for output, value in property_values.items() if is_edit_output(output)))
+
+
+def is_edit_output(output):
+    property_path = morph_graph.parse_uri(output)[1]
+    return True in [property_path.startswith(et) for et in EDIT_TRANSFORMS]
+
+
+def process_formula_outputs(bl_obj, outputs):
+    """ All morphs have already been handled by the morph graph, outputs maps the urls of all other properties
+    that will be transformed / changed here to their combined formula values """
     arm = None
     pose_bone_transformations = OrderedDict()
     edit_bone_transformations = OrderedDict()
-    for _, formula_result in combined.items():
-        uri = Uri(formula_result.output)
-        asset_id = uri.asset_id
-        property_path = uri.property_path
+    for output, value in outputs.items():
+        asset_id, property_path = morph_graph.parse_uri(output)
 
-        pose_transforms = ["rotation", "translation", "scale"]
-        edit_transforms = ["center_point", "end_point", "orientation"]
-        is_pose = True in [property_path.startswith(pt) for pt in pose_transforms]
-        is_edit = True in [property_path.startswith(pt) for pt in edit_transforms]
+        is_pose = True in [property_path.startswith(pt) for pt in POSE_TRANSFORMS]
+        is_edit = True in [property_path.startswith(et) for et in EDIT_TRANSFORMS]
 
         if is_pose or is_edit:
             arm, pose_bone = find_pose_bone(bl_obj, asset_id)
@@ -198,31 +315,19 @@ def process_formula_outputs(bl_obj, bl_morph, outputs):
 
                 transform = property_path.split("/")[-2]
                 axis = property_path.split("/")[-1]
-                bt.update(transform, axis, formula_result.value)
-
-    if len(pose_bone_transformations) > 0:
-        old_obj = bpy.context.active_object
-        bpy.context.scene.objects.active = arm
-        old_mode = arm.mode
-        bpy.ops.object.mode_set(mode='EDIT')
-        for _, pbt in pose_bone_transformations.items():
-            log.debug("apply pose to %s rot=%s scale=%s translation=%s" % (pbt.bone_name, pbt.rotation, pbt.scale, pbt.translation))
-            pose_import.apply_rotation(arm, pbt.bone_name, *pbt.rotation)
-            pose_import.apply_scale(arm, pbt.bone_name, *pbt.scale)
-            pose_import.apply_translation(arm, pbt.bone_name, *pbt.translation)
-        bpy.ops.object.mode_set(mode=old_mode)
-        bpy.context.scene.objects.active = old_obj
-
-    if len(edit_bone_transformations) > 0:
-        old_obj = bpy.context.active_object
-        bpy.context.scene.objects.active = arm
-        old_mode = arm.mode
-        bpy.ops.object.mode_set(mode='EDIT')
-        for _, ebt in edit_bone_transformations.items():
-            log.debug("apply transform to edit bone %s cp=%s ep=%s orient=%s" % (ebt.bone_name, ebt.center_point, ebt.end_point, ebt.orientation))
-            armature.transform_edit_bone(arm, ebt.bone_name, ebt.center_point, ebt.end_point, ebt.orientation)
-        bpy.ops.object.mode_set(mode=old_mode)
-        bpy.context.scene.objects.active = old_obj
+                bt.update(transform, axis, value)
+
+    # applied together with the other bone writes of the running armature edit session
+    for _, pbt in pose_bone_transformations.items():
+        log.debug("apply pose to %s rot=%s scale=%s translation=%s" % (pbt.bone_name, pbt.rotation, pbt.scale, pbt.translation))
+        armature.queue_pose_bone_write(partial(pose_import.apply_rotation, arm, pbt.bone_name, *pbt.rotation))
+        armature.queue_pose_bone_write(partial(pose_import.apply_scale, arm, pbt.bone_name, *pbt.scale))
+        armature.queue_pose_bone_write(partial(pose_import.apply_translation, arm, pbt.bone_name, *pbt.translation))
+
+    for _, ebt in edit_bone_transformations.items():
+        log.debug("apply transform to edit bone %s cp=%s ep=%s orient=%s" % (ebt.bone_name, ebt.center_point, ebt.end_point, ebt.orientation))
+        armature.queue_edit_bone_write(arm, partial(armature.transform_edit_bone, arm, ebt.bone_name,
+                                                    ebt.center_point, ebt.end_point, ebt.orientation))
 
 
 def find_pose_bone(bl_obj, bone_name):
@@ -254,99 +359,14 @@ class BoneTransformation:
             getattr(self, transform)[map[axis]] = value
 
 
-class FormulaResult:
-    def __init__(self, output, stage, value):
-        self.output = output
-        self.stage = stage
-        self.value = value
-
-
-def execute_operation(bl_obj, stack, bl_operation):
-    op = bl_operation.op
-    operators = {
-        "push": execute_push,
-        "add": partial(execute_arith, lambda a, b: a + b),
-        "sub": partial(execute_arith, lambda a, b: a - b),
-        "mult": partial(execute_arith, lambda a, b: a * b),
-        "div": partial(execute_arith, lambda a, b: a / b)
-    }
-    operators[op](bl_obj, stack, bl_operation)
-
-
-def execute_push(bl_obj, stack, bl_operation):
-    val = bl_operation.val
-    if len(bl_operation.url) > 0:
-        val = resolve_url_to_val(bl_obj, bl_operation.url)
-    stack.append(val)
-
-
-def execute_arith(arith, bl_obj, stack, bl_operation):
-    a = stack.pop()
-    b = stack.pop()
-    result = arith(a, b)
-    stack.append(result)
-
-
-def resolve_url_to_val(bl_obj, url):
-    uri = Uri(url)
-    asset_id = uri.asset_id
-    property_path = uri.property_path
-
-    morph = find_morph(bl_obj, asset_id)
-    if morph:
-        # assume property_path is always 'value'
-        return morph.value
-
-    # TODO bones, nodes
-    return -1.99
-
-
 def find_morph(bl_obj, morph_name):
-    return bl_obj.bdst_morphs.get(morph_name, None)
-
-
-def find_shape_key(bl_obj, morph_name):
-    log.debug("search morph " + morph_name)
-    return bl_obj.data.shape_keys.key_blocks.get(morph_name, None)
-
-
-def create_shapekey(bl_obj, modifier):
-    base_shape_key = get_base_shape_key(bl_obj)
-    log.debug("modifier %s type=%s" % (modifier.id, modifier.type))
-
-    shape_key_name = modifier.id
-    shape_key = bl_obj.shape_key_add(shape_key_name)
-    shape_key_data = shape_key.data
-    shape_key_values = shape_key_data.values()
-    for (delta_idx, x, y, z) in modifier.morph.vertex_deltas:
-        # add the deltas to their respective shape-key coordinates.
-        shape_key_values[delta_idx].co += Vector((x / 100.0, z / -100.0, y / 100.0))
-
-
-def get_base_shape_key(obj):
-    """get or create the base shapekey for object.
-    """
-    if obj.data.shape_keys is None:
-        base_shape_key = obj.shape_key_add('base')
-    else:
-        base_shape_key = obj.data.shape_keys.reference_key
-    return base_shape_key
-
-
-class BlenderOperation(bpy.types.PropertyGroup):
-    op = bpy.props.StringProperty(name="op")
-    val = bpy.props.FloatProperty(name="val")
-    url = bpy.props.StringProperty(name="url")
-
-
-class BlenderFormula(bpy.types.PropertyGroup):
-    output = bpy.props.StringProperty(name="output")
-    operations = bpy.props.CollectionProperty(type=BlenderOperation)
-    stage = bpy.props.StringProperty(name="stage", default="sum")
+    i = morph_store.get_store(bl_obj).position(bl_obj, morph_name)
+    return bl_obj.bdst_morphs[i] if i is not None else None
 
 
 class BlenderMorph(bpy.types.PropertyGroup):
-    formulas = bpy.props.CollectionProperty(type=BlenderFormula)
+    # source file, load state and formulas of the morphs are kept in the object's morph store
+    label = bpy.props.StringProperty(name="label")
     visible = bpy.props.BoolProperty(name="visible")
     value = bpy.props.FloatProperty(name="Value", min=-5.0, max=5.0, subtype='FACTOR',
                                     get=get_morph_value, set=set_morph_value)
@@ -371,7 +391,7 @@ class MorphList(bpy.types.UIList):
 
         if self.layout_type in {'DEFAULT', 'COMPACT'}:
             split = layout.split(0.66, False)
-            split.prop(bl_morph, "name", text="", emboss=False, icon='SHAPEKEY_DATA')
+            split.label(text=bl_morph.label or bl_morph.name, icon='SHAPEKEY_DATA')
             row = split.row(align=True)
             row.prop(bl_morph, "value", text="", emboss=False)
         elif self.layout_type == 'GRID':
@@ -418,6 +438,27 @@ class MorphPanel(bpy.types.Panel):
         if bl_obj and bl_obj.type == 'MESH':
             active_morph = bl_obj.bdst_morphs[bl_obj.bdst_active_morph_index]
             layout.prop(active_morph, "value")
+            info = find_morph_info(active_morph)
+            if info is not None:
+                layout.label(text="%d deltas" % info.delta_count)
+                if len(info.targets) > 0:
+                    layout.label(text="drives " + ", ".join(info.targets))
+            if bl_obj.bdst_morph_drivers:
+                layout.operator(morph_drivers.MorphDriverRemover.bl_idname, text="Remove Drivers")
+            else:
+                layout.operator(morph_drivers.MorphDriverCreator.bl_idname, text="Use Drivers")
+
+
+def find_morph_info(bl_morph):
+    """MorphInfo of a morph from the manifest of its Morphs directory, None if no manifest was loaded"""
+    filepath = morph_store.get_store(bl_morph.id_data).filepath(bl_morph.name)
+    manifest = morph_manifest.find_manifest(filepath) if len(filepath) > 0 else None
+    if manifest is None:
+        return None
+    for info in manifest.infos(filepath):
+        if info.id == bl_morph.name:
+            return info
+    return None
 
 
 class MorphImporter(bpy.types.Operator):
@@ -433,7 +474,8 @@ class MorphImporter(bpy.types.Operator):
             default="")
 
     def execute(self, context):
-        load_morph(self.properties.filepath, context)
+        with ImportTransaction("import morph"):
+            load_morph(self.properties.filepath, context)
         return {"FINISHED"}
 
     def invoke(self, context, event):
@@ -442,28 +484,72 @@ class MorphImporter(bpy.types.Operator):
         return {"RUNNING_MODAL"}
 
 
+class MorphValueSetter(bpy.types.Operator):
+    bl_label = "set morph values"
+    bl_idname = "bdst.set_morph_values"
+    bl_description = "Set several morphs of the active object at once, e.g. from a preset"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    values = StringProperty(
+            name="values",
+            description="json object that maps morph ids to values",
+            default="{}")
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and len(context.active_object.bdst_morphs) > 0
+
+    def execute(self, context):
+        try:
+            values = json.loads(self.values)
+        except ValueError as e:
+            self.report({'ERROR'}, "Invalid morph values: %s" % e)
+            return {"CANCELLED"}
+        if not isinstance(values, dict):
+            self.report({'ERROR'}, "Invalid morph values: expected a json object")
+            return {"CANCELLED"}
+        for morph_id, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                self.report({'ERROR'}, "Invalid value of morph %s: %s" % (morph_id, json.dumps(value)))
+                return {"CANCELLED"}
+        set_morph_values(context.active_object, values)
+        return {"FINISHED"}
+
+
 def morph_import_menu(self, context):
     self.layout.operator(MorphImporter.bl_idname, text = "DSON/dsf morph (.dsf)")
 
 
 def register():
     bpy.utils.register_class(MorphImporter)
+    bpy.utils.register_class(MorphValueSetter)
     bpy.utils.register_class(MorphPanel)
-    bpy.utils.register_class(BlenderOperation)
-    bpy.utils.register_class(BlenderFormula)
     bpy.utils.register_class(BlenderMorph)
     bpy.utils.register_class(MorphList)
 
     bpy.types.INFO_MT_file_import.append(morph_import_menu)
     bpy.types.Object.bdst_morphs = bpy.props.CollectionProperty(type=BlenderMorph)
     bpy.types.Object.bdst_active_morph_index = bpy.props.IntProperty()
+    bpy.types.Object.bdst_morph_store = bpy.props.StringProperty(name="morph store")
+    bpy.types.Object.bdst_morph_id = bpy.props.StringProperty(name="morph cache id")
+    bpy.app.handlers.load_post.append(clear_morph_caches)
+    bpy.app.handlers.undo_post.append(clear_morph_caches)
+    bpy.app.handlers.redo_post.append(clear_morph_caches)
+    bpy.app.handlers.save_pre.append(save_morph_stores)
+    bpy.app.handlers.scene_update_post.append(update_corrective_morphs)
+    bpy.app.handlers.frame_change_post.append(update_corrective_morphs)
 
 
 def unregister():
     bpy.utils.unregister_class(MorphImporter)
+    bpy.utils.unregister_class(MorphValueSetter)
     bpy.utils.unregister_class(MorphPanel)
-    bpy.utils.unregister_class(BlenderOperation)
-    bpy.utils.unregister_class(BlenderFormula)
     bpy.utils.unregister_class(BlenderMorph)
     bpy.utils.unregister_class(MorphList)
     bpy.types.INFO_MT_file_import.remove(morph_import_menu)
+    bpy.app.handlers.scene_update_post.remove(update_corrective_morphs)
+    bpy.app.handlers.frame_change_post.remove(update_corrective_morphs)
+    bpy.app.handlers.load_post.remove(clear_morph_caches)
+    bpy.app.handlers.undo_post.remove(clear_morph_caches)
+    bpy.app.handlers.redo_post.remove(clear_morph_caches)
+    bpy.app.handlers.save_pre.remove(save_morph_stores)
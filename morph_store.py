@@ -0,0 +1,167 @@
+import base64
+import json
+import logging
+import uuid
+import zlib
+
+import bpy
+
+log = logging.getLogger(__name__)
+
+# bump when the layout of the stored data changes
+FORMAT_VERSION = 1
+
+_stores = {}  # cache key, see cache_key -> MorphStore
+
+
+class MorphStore:
+    """the formulas, source files and load state of the morphs of an object.
+    decoded once per session, bl_obj.bdst_morphs only holds what the morph list shows (id, label, visible,
+    value). the object stores it as one blob, bdst_morph_store: json in which every url, file path and
+    other string is stored once in a string table, compressed with zlib and base64 encoded.
+    """
+
+    def __init__(self):
+        self.filepaths = {}  # morph id -> dsf file its shape key and formulas are loaded from
+        self.loaded = set()  # ids of the morphs whose shape key and formulas were loaded
+        self.formulas = {}   # morph id -> [(output, stage, [(op, val, url)])]
+        self.positions = {}  # morph id -> index in bdst_morphs
+        self.changed = False
+
+    def add_morph(self, morph_id, filepath, position):
+        self.filepaths[morph_id] = filepath
+        self.positions[morph_id] = position
+        self.changed = True
+
+    def is_loaded(self, morph_id):
+        # morphs without file were created with their data
+        return morph_id in self.loaded or len(self.filepaths.get(morph_id, "")) == 0
+
+    def set_loaded(self, morph_id, formulas):
+        self.loaded.add(morph_id)
+        self.formulas[morph_id] = formulas
+        self.changed = True
+
+    def get_formulas(self, morph_id):
+        return self.formulas.get(morph_id, ())
+
+    def filepath(self, morph_id):
+        return self.filepaths.get(morph_id, "")
+
+    def position(self, bl_obj, morph_id):
+        """index of a morph in bl_obj.bdst_morphs without a linear search, None if there is no such morph"""
+        morphs = bl_obj.bdst_morphs
+        if len(self.positions) != len(morphs):
+            self.positions = {bl_morph.name: i for i, bl_morph in enumerate(morphs)}
+        return self.positions.get(morph_id, None)
+
+    def encode(self):
+        strings = []
+        string_index = {}
+
+        def intern(s):
+            if s not in string_index:
+                string_index[s] = len(strings)
+                strings.append(s)
+            return string_index[s]
+
+        morphs = []
+        for morph_id in sorted(set(self.filepaths) | set(self.formulas)):
+            formulas = [[intern(output), intern(stage), [[intern(op), val, intern(url)] for op, val, url in operations]]
+                        for output, stage, operations in self.get_formulas(morph_id)]
+            morphs.append([intern(morph_id), intern(self.filepath(morph_id)), morph_id in self.loaded, formulas])
+        data = {"version": FORMAT_VERSION, "strings": strings, "morphs": morphs}
+        text = json.dumps(data, separators=(",", ":"))
+        return base64.b64encode(zlib.compress(text.encode("utf-8"))).decode("ascii")
+
+    def decode(self, blob):
+        data = json.loads(zlib.decompress(base64.b64decode(blob)).decode("utf-8"))
+        if data.get("version", None) != FORMAT_VERSION:
+            raise Exception("unknown morph store version %s" % data.get("version", None))
+        strings = data["strings"]
+        for morph_id, filepath, loaded, formulas in data["morphs"]:
+            morph_id = strings[morph_id]
+            self.filepaths[morph_id] = strings[filepath]
+            if loaded:
+                self.loaded.add(morph_id)
+            if len(formulas) > 0:
+                self.formulas[morph_id] = [
+                    (strings[output], strings[stage], [(strings[op], val, strings[url]) for op, val, url in operations])
+                    for output, stage, operations in formulas]
+
+
+def cache_key(bl_obj):
+    """key of the session caches of an object: its pointer and a persistent id.
+    blender reuses the memory of deleted objects, the id tells a new object at the same address apart.
+    copies of an object share the id but not the pointer.
+    """
+    if len(bl_obj.bdst_morph_id) == 0:
+        try:
+            bl_obj.bdst_morph_id = uuid.uuid4().hex
+        except AttributeError:
+            # objects cannot be written while the ui is drawn, the next operator or handler sets the id
+            pass
+    return bl_obj.as_pointer(), bl_obj.bdst_morph_id
+
+
+def get_store(bl_obj):
+    """the MorphStore of the object, decoded from the object on first use"""
+    key = cache_key(bl_obj)
+    store = _stores.get(key, None)
+    if store is None:
+        # the store of a deleted object at the same address
+        for old_key in [k for k in _stores if k[0] == key[0]]:
+            del _stores[old_key]
+        store = MorphStore()
+        if len(bl_obj.bdst_morph_store) > 0:
+            try:
+                store.decode(bl_obj.bdst_morph_store)
+            except Exception as e:
+                log.error("could not read the morphs of %s: %s" % (bl_obj.name, e))
+        else:
+            migrate(bl_obj, store)
+        _stores[key] = store
+    return store
+
+
+def migrate(bl_obj, store):
+    """move the file, load state and formulas that older versions kept in each morph into the store"""
+    for bl_morph in bl_obj.bdst_morphs:
+        if "filepath" not in bl_morph and "formulas" not in bl_morph:
+            continue
+        store.filepaths[bl_morph.name] = bl_morph.get("filepath", "")
+        if bl_morph.get("loaded", False):
+            store.loaded.add(bl_morph.name)
+        formulas = []
+        for bl_formula in bl_morph.get("formulas", []):
+            operations = [(o.get("op", ""), o.get("val", 0.0), o.get("url", "")) for o in bl_formula.get("operations", [])]
+            formulas.append((bl_formula.get("output", ""), bl_formula.get("stage", "sum"), operations))
+        if len(formulas) > 0:
+            store.formulas[bl_morph.name] = formulas
+        for key in ("filepath", "loaded", "formulas"):
+            if key in bl_morph:
+                del bl_morph[key]
+        store.changed = True
+    if store.changed:
+        log.info("moved the morph formulas of %s into the morph store" % bl_obj.name)
+
+
+def save(bl_obj):
+    """write the store of bl_obj back into the object if it changed"""
+    store = _stores.get((bl_obj.as_pointer(), bl_obj.bdst_morph_id), None)
+    if store is not None and store.changed:
+        bl_obj.bdst_morph_store = store.encode()
+        store.changed = False
+
+
+def save_all():
+    """write all changed stores, before undo steps are pushed and before the file is saved"""
+    if not any(store.changed for store in _stores.values()):
+        return
+    for bl_obj in bpy.data.objects:
+        save(bl_obj)
+
+
+def clear():
+    """forget the decoded stores, after undo or loading a file the objects hold the current data"""
+    _stores.clear()
@@ -11,6 +11,7 @@ from mathutils import Matrix
 
 from bpy.props import BoolProperty, StringProperty
 from . import types
+from .transaction import ImportTransaction
 
 log = logging.getLogger(__name__)
 
@@ -28,7 +29,8 @@ class PoseImporter(bpy.types.Operator):
             default="")
 
     def execute(self, context):
-        load_pose(self.properties.filepath, context)
+        with ImportTransaction("import pose"):
+            load_pose(self.properties.filepath, context)
         return {"FINISHED"}
 
     def invoke(self, context, event):
@@ -38,12 +40,12 @@ class PoseImporter(bpy.types.Operator):
 
 
 def apply_scale(bl_obj, bone_name, x, y, z):
-    edit_bone, pose_bone = find_edit_and_pose_bone(bl_obj, bone_name)
-    if edit_bone is None or pose_bone is None:
+    bone, pose_bone = find_bone_and_pose_bone(bl_obj, bone_name)
+    if bone is None or pose_bone is None:
         log.error("bone not found %s" % bone_name)
         return
 
-    a, b, c = transform_bone_orientation(edit_bone, x, y, z)
+    a, b, c = transform_bone_orientation(bone, x, y, z)
 
     scale = pose_bone.scale
     if a is None or a == "":
@@ -65,12 +67,12 @@ def apply_scale(bl_obj, bone_name, x, y, z):
 
 
 def apply_translation(bl_obj, bone_name, x, y, z):
-    edit_bone, pose_bone = find_edit_and_pose_bone(bl_obj, bone_name)
-    if edit_bone is None or pose_bone is None:
+    bone, pose_bone = find_bone_and_pose_bone(bl_obj, bone_name)
+    if bone is None or pose_bone is None:
         log.error("bone not found %s" % bone_name)
         return
 
-    a, b, c = transform_bone_orientation(edit_bone, x, y, z)
+    a, b, c = transform_bone_orientation(bone, x, y, z)
 
     location = pose_bone.location
     if a is None or a == "":
@@ -84,12 +86,12 @@ def apply_translation(bl_obj, bone_name, x, y, z):
 
 
 def apply_rotation(bl_obj, bone_name, x, y, z):
-    edit_bone, pose_bone = find_edit_and_pose_bone(bl_obj, bone_name)
-    if edit_bone is None or pose_bone is None:
+    bone, pose_bone = find_bone_and_pose_bone(bl_obj, bone_name)
+    if bone is None or pose_bone is None:
         log.error("bone not found %s" % bone_name)
         return
 
-    a, b, c = transform_bone_orientation(edit_bone, x, y, z)
+    a, b, c = transform_bone_orientation(bone, x, y, z)
 
     if a is None or a == "":
         a = pose_bone.rotation_euler[0]
@@ -101,9 +103,10 @@ def apply_rotation(bl_obj, bone_name, x, y, z):
     pose_bone.rotation_euler = (radians(a), radians(b), radians(c))
 
 
-def transform_bone_orientation(edit_bone, x, y, z):
-    sign = 1 if edit_bone.bdst_sign[0] == "+" else -1
-    mode = edit_bone.bdst_sign[1]
+def transform_bone_orientation(bone, x, y, z):
+    """bone: Bone or EditBone, both carry the bdst_* properties"""
+    sign = 1 if bone.bdst_sign[0] == "+" else -1
+    mode = bone.bdst_sign[1]
     a = None
     b = None
     c = None
@@ -131,17 +134,18 @@ def transform_bone_orientation(edit_bone, x, y, z):
     return a, b, c
 
 
-def find_edit_and_pose_bone(bl_armature, bone_name):
-    if bone_name not in bl_armature.data.edit_bones:
-        bone = find_bone_by_instance_id(bone_name, bl_armature.data.edit_bones)
+def find_bone_and_pose_bone(bl_armature, bone_name):
+    """pose writes only need the bone's bdst_* properties, so they work without edit mode"""
+    if bone_name not in bl_armature.data.bones:
+        bone = find_bone_by_instance_id(bone_name, bl_armature.data.bones)
         if bone is None:
             return None, None
         bone_name = bone.name
-    return bl_armature.data.edit_bones[bone_name], bl_armature.pose.bones[bone_name]
+    return bl_armature.data.bones[bone_name], bl_armature.pose.bones[bone_name]
 
 
-def find_bone_by_instance_id(instance_id, edit_bones):
-    for bone in edit_bones:
+def find_bone_by_instance_id(instance_id, bones):
+    for bone in bones:
         if bone.bdst_instance_id == instance_id:
             return bone
     return None
@@ -150,9 +154,8 @@ def find_bone_by_instance_id(instance_id, edit_bones):
 def load_pose(filepath, context):
     start_time = time.time()
 
-    asset = types.Asset(filepath)
+    asset = types.get_asset(filepath, sections=["scene"])
     bl_obj = context.active_object
-    bpy.ops.object.mode_set(mode='EDIT')
 
     animations = asset.scene.animations
     for bone, rot in asset.scene.bone_rot.items():
@@ -168,8 +171,6 @@ def load_pose(filepath, context):
         log.debug("%s: x=%.3f y=%.3f z=%.3f" % (bone, x, y, z))
         apply_rotation(bl_obj, bone, x, y, z)
 
-    bpy.ops.object.mode_set(mode='OBJECT')
-
     end_time = time.time()
     elapsed_time = end_time - start_time
     log.debug("imported %d animations in %.3f seconds" % (len(animations), elapsed_time))
@@ -0,0 +1,94 @@
+import logging
+
+import bpy
+
+from . import morph_deltas
+from . import morph_store
+from .armature import ArmatureEditSession
+
+log = logging.getLogger(__name__)
+
+_active = []  # stack of running transactions, the innermost is last
+
+
+class ImportTransaction:
+    """batches the scene changes of an import.
+    objects are linked to the scene together when the transaction ends and the scene is updated only once.
+    bone writes are collected in an ArmatureEditSession and applied with one edit mode switch per armature.
+    global undo is suspended while the import runs, so the operators called during the import
+    (mode switches etc.) do not store the whole file each time. afterwards one undo step is pushed,
+    unless undo is switched off for imports in the add-on preferences.
+
+        with ImportTransaction("import asset"):
+            ...
+            link_object(bl_obj)
+    """
+
+    def __init__(self, name, scene=None):
+        self.name = name
+        self.scene = scene
+        self.pending = []
+        self.old_global_undo = None
+        self.edit_session = ArmatureEditSession()
+
+    def __enter__(self):
+        if self.scene is None:
+            self.scene = bpy.context.scene
+        if len(_active) == 0:
+            edit_prefs = bpy.context.user_preferences.edit
+            self.old_global_undo = edit_prefs.use_global_undo
+            edit_prefs.use_global_undo = False
+        _active.append(self)
+        self.edit_session.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            try:
+                # bone writes first, they need the armatures in edit mode
+                self.edit_session.__exit__(exc_type, exc_value, traceback)
+            finally:
+                # also on errors, so that the objects created so far are not left orphaned
+                self.flush()
+            if exc_type is None:
+                morph_store.save_all()
+                morph_deltas.save_all()
+        finally:
+            # a failed transaction must neither stay active nor keep global undo switched off
+            _active.remove(self)
+            if self.old_global_undo is not None:
+                bpy.context.user_preferences.edit.use_global_undo = self.old_global_undo
+        if self.old_global_undo and exc_type is None and undo_imports():
+            bpy.ops.ed.undo_push(message=self.name)
+        return False
+
+    def link(self, bl_obj):
+        self.pending.append(bl_obj)
+
+    def flush(self):
+        """link the queued objects and update the scene"""
+        log.debug("%s: linking %d objects" % (self.name, len(self.pending)))
+        objects = self.scene.objects
+        for bl_obj in self.pending:
+            if bl_obj.name not in objects:
+                objects.link(bl_obj)
+        self.pending = []
+        self.scene.update()
+
+
+def current_transaction():
+    return _active[-1] if len(_active) > 0 else None
+
+
+def link_object(bl_obj):
+    """link bl_obj to the scene, deferred until the end of the running transaction if there is one"""
+    transaction = current_transaction()
+    if transaction is not None:
+        transaction.link(bl_obj)
+    else:
+        bpy.context.scene.objects.link(bl_obj)
+
+
+def undo_imports():
+    addon_prefs = bpy.context.user_preferences.addons["bds-tools"].preferences
+    return addon_prefs.undo_imports
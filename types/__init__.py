@@ -1,4 +1,8 @@
 from . import asset
+from . import asset_cache
+from . import disk_cache
+from . import document
+from . import dson_reader
 from . import geometry
 from . import geometry_library
 from . import image
@@ -8,6 +12,7 @@ from . import material_library
 from . import modifier
 from . import modifier_instance
 from . import modifier_library
+from . import morph_manifest
 from . import node
 from . import node_instance
 from . import node_library
@@ -15,7 +20,7 @@ from . import scene
 from . import util
 from . import uv_set
 from . import uv_set_library
-from .asset import Asset
+from .asset import Asset, get_asset
 
 
 
@@ -1,14 +1,15 @@
 import os
 
 import bpy
-import json
 import logging
 import urllib.parse
+from collections import OrderedDict
 
 
 log = logging.getLogger(__name__)
 
-from .util import open_text_file
+from . import asset_cache
+from .document import load_document
 from .geometry_library import GeometryLibrary
 from .material_library import MaterialLibrary
 from .scene import Scene
@@ -18,25 +19,46 @@ from .modifier_library import ModifierLibrary
 from .image_library import ImageLibrary
 
 
+# sections of an asset, each one is parsed on first access
+SECTIONS = OrderedDict([
+    ("uv_set_library", UvSetLibrary),
+    ("geometry_library", GeometryLibrary),
+    ("material_library", MaterialLibrary),
+    ("image_library", ImageLibrary),
+    ("node_library", NodeLibrary),
+    ("modifier_library", ModifierLibrary),
+    ("scene", Scene),
+])
+
+
 class Asset:
-    def __init__(self, filepath):
+    def __init__(self, filepath, sections=None):
+        """sections: names of the sections (see SECTIONS) the caller needs, None for all sections"""
         self.filepath = filepath
         self.root_path = self.find_root_path(filepath)
-        reader = open_text_file(filepath)
-        json_asset = json.load(reader)
+        self.sections = frozenset(sections) if sections is not None else None
+        # sections that will never be parsed are not kept
+        skip = [s for s in SECTIONS if not self.has_section(s)]
+        json_asset = load_document(filepath, skip)
 
+        # holds the raw json of sections until they are parsed
         self.json_asset = json_asset
         self.asset_id = urllib.parse.unquote(json_asset["asset_info"]["id"])
 
-        self.supporting_assets = {}
-        self.uv_set_library = UvSetLibrary(self, json_asset)
-        self.geometry_library = GeometryLibrary(self, json_asset)
-        self.material_library = MaterialLibrary(self, json_asset)
-        self.image_library = ImageLibrary(self, json_asset)
-        self.node_library = NodeLibrary(self, json_asset)
-        self.modifier_library = ModifierLibrary(self, json_asset)
-
-        self.scene = Scene(self, self.json_asset)
+    def __getattr__(self, attr):
+        # only called if attr is not set yet, i.e. section has not been parsed
+        if attr not in SECTIONS:
+            raise AttributeError(attr)
+        if not self.has_section(attr):
+            raise Exception("section %s was not loaded for asset %s" % (attr, self.filepath))
+        log.debug("parsing %s of %s" % (attr, self.filepath))
+        section = SECTIONS[attr](self, self.json_asset)
+        setattr(self, attr, section)
+        self.json_asset.pop(attr, None)
+        return section
+
+    def has_section(self, name):
+        return self.sections is None or name in self.sections
 
     def find_root_path(self, filepath):
         #return filepath.split("Content")[0] + "Content"
@@ -48,7 +70,7 @@ class Asset:
         return content_root
 
     def find_geometry(self, url):
-        return self.internal_find_object(url, self.geometry_library)
+        return self.internal_find_object(url, "geometry_library")
 
     def find_geometry_instance(self, url):
         log.debug("searching for geometry instance " + url)
@@ -57,29 +79,28 @@ class Asset:
             raise Exception("url has no id: " + url)
         path, id = url.split("#")
 
-        for node in self.scene.nodes:
-            for geom in node.geometries:
-                if geom.id == id:
-                    log.debug("found it, geometry instance was already loaded")
-                    return geom
+        geom = self.scene.find_geometry(id)
+        if geom is not None:
+            log.debug("found it, geometry instance was already loaded")
+            return geom
         raise Exception("could not find geometry instance with url " + url)
 
     def find_node(self, url):
-        return self.internal_find_object(url, self.node_library)
+        return self.internal_find_object(url, "node_library")
 
     def find_material(self, url):
-        return self.internal_find_object(url, self.material_library)
+        return self.internal_find_object(url, "material_library")
 
     def find_uv_set(self, url):
-        return self.internal_find_object(url, self.uv_set_library)
+        return self.internal_find_object(url, "uv_set_library")
 
     def find_modifier(self, url):
-        return self.internal_find_object(url, self.modifier_library)
+        return self.internal_find_object(url, "modifier_library")
 
     def find_image(self, url):
-        return self.internal_find_object(url, self.image_library)
+        return self.internal_find_object(url, "image_library")
 
-    def internal_find_object(self, url, collection):
+    def internal_find_object(self, url, library_name):
         log.debug("searching for object " + url)
         url = urllib.parse.unquote(url)
         if url.find("#") < 0:
@@ -87,32 +108,19 @@ class Asset:
         path, id = url.split("#")
 
         if len(path) == 0:
-            object = collection.find(id)
+            object = getattr(self, library_name).find(id)
             if object is not None:
                 log.debug("found it, object was already loaded")
                 return object
             else:
                 raise Exception("local id but asset could not be found " + url)
 
-        if path not in self.supporting_assets:
-            log.debug("loading support asset")
-            support_asset = Asset(self.root_path + path)
-            self.supporting_assets[path] = support_asset
+        # resolved through the asset cache on every lookup, keeping a reference here would keep
+        # assets alive after the cache evicted them
+        support_asset = get_asset(self.root_path + path)
 
         # hmm, id's have to be unique within one file. merge find over all libraries?
-        object = None
-        if collection is self.uv_set_library:
-            object = self.supporting_assets[path].uv_set_library.find(id)
-        elif collection is self.geometry_library:
-            object = self.supporting_assets[path].geometry_library.find(id)
-        elif collection is self.material_library:
-            object = self.supporting_assets[path].material_library.find(id)
-        elif collection is self.node_library:
-            object = self.supporting_assets[path].node_library.find(id)
-        elif collection is self.modifier_library:
-            object = self.supporting_assets[path].modifier_library.find(id)
-        elif collection is self.image_library:
-            object = self.supporting_assets[path].image_library.find(id)
+        object = getattr(support_asset, library_name).find(id)
 
         if object is not None:
             log.debug("found object in support asset")
@@ -124,3 +132,6 @@ class Asset:
             raise Exception("could not find object with url " + url)
 
 
+def get_asset(filepath, sections=None):
+    """return the parsed asset for filepath, reusing an already parsed one from the asset cache"""
+    return asset_cache.get_asset(filepath, Asset, sections)
@@ -0,0 +1,100 @@
+import logging
+import os
+import struct
+from collections import OrderedDict, namedtuple
+
+from .util import fix_broken_path
+
+log = logging.getLogger(__name__)
+
+CacheEntry = namedtuple("CacheEntry", ["key", "asset", "size"])
+
+
+class AssetCache:
+    """LRU cache for parsed assets, shared by all importers of a session.
+    Entries are keyed by the resolved file path and validated against the file's mtime and size,
+    the memory budget is measured in bytes of uncompressed DSON text.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()  # resolved path -> CacheEntry, least recently used first
+
+    def get(self, filepath, loader, sections=None):
+        path = resolve_path(filepath)
+        stat = os.stat(path)
+        key = (stat.st_mtime, stat.st_size)
+
+        entry = self.entries.get(path, None)
+        if entry is not None and entry.key == key and covers_sections(entry.asset, sections):
+            log.debug("asset cache hit %s" % path)
+            self.entries.move_to_end(path)
+            return entry.asset
+        if entry is not None:
+            log.debug("asset cache entry outdated %s" % path)
+            self.remove(path)
+
+        asset = loader(path, sections)
+        size = uncompressed_size(path, stat.st_size)
+        if size <= self.max_size:
+            self.entries[path] = CacheEntry(key, asset, size)
+            self.size += size
+            self.evict()
+        return asset
+
+    def remove(self, path):
+        entry = self.entries.pop(path)
+        self.size -= entry.size
+
+    def evict(self):
+        while self.size > self.max_size and len(self.entries) > 0:
+            path, entry = self.entries.popitem(last=False)
+            self.size -= entry.size
+            log.debug("evicted %s from asset cache" % path)
+
+    def resize(self, max_size):
+        self.max_size = max_size
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+def covers_sections(asset, sections):
+    if sections is None:
+        return asset.sections is None
+    return all(asset.has_section(s) for s in sections)
+
+
+def resolve_path(filepath):
+    if not os.path.exists(filepath):
+        filepath = fix_broken_path(filepath)
+    return os.path.normcase(os.path.realpath(filepath))
+
+
+def uncompressed_size(path, file_size):
+    """gzip stores the uncompressed size (mod 2^32) in the last four bytes of the file"""
+    with open(path, 'rb') as f:
+        if f.read(2) != b'\x1f\x8b' or file_size < 4:
+            return file_size
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack("<I", f.read(4))[0]
+
+
+DEFAULT_SIZE_MB = 512
+
+_cache = AssetCache(DEFAULT_SIZE_MB * 1024 * 1024)
+
+
+def configure(max_size_mb):
+    _cache.resize(max_size_mb * 1024 * 1024)
+
+
+def get_asset(filepath, loader, sections=None):
+    return _cache.get(filepath, loader, sections)
+
+
+def clear():
+    _cache.clear()
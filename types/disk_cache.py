@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+
+import numpy
+
+from .util import fix_broken_path
+
+log = logging.getLogger(__name__)
+
+# bump when the layout of cached documents changes, old entries are then ignored
+FORMAT_VERSION = 1
+MAGIC = ("BDSTDC%02d" % FORMAT_VERSION).encode("ascii")
+ALIGNMENT = 64
+ARRAY_MARKER = "__bdst_array__"
+
+_cache_dir = None
+_hashes = {}  # (path, mtime, size) -> content hash, avoids hashing unchanged files twice per session
+
+
+def configure(cache_dir):
+    global _cache_dir
+    _cache_dir = cache_dir if cache_dir and len(cache_dir) > 0 else None
+    if _cache_dir and not os.path.isdir(_cache_dir):
+        try:
+            os.makedirs(_cache_dir)
+        except OSError as e:
+            log.error("could not create cache directory %s, caching is disabled: %s" % (_cache_dir, e))
+            _cache_dir = None
+
+
+def get_cache_dir():
+    return _cache_dir
+
+
+def is_enabled():
+    return _cache_dir is not None
+
+
+def cache_path(name):
+    """path of a file with the given name in the cache directory, None if the cache is disabled"""
+    if not is_enabled():
+        return None
+    return os.path.join(_cache_dir, name)
+
+
+def contains(filepath):
+    return is_enabled() and os.path.exists(find_cache_file(filepath))
+
+
+def load(filepath):
+    """return the cached document for filepath or None.
+    numeric arrays of the document are memory-mapped from the cache file.
+    """
+    if not is_enabled():
+        return None
+    cache_file = find_cache_file(filepath)
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        return read(cache_file)
+    except Exception as e:
+        log.error("could not read cache file %s: %s" % (cache_file, e))
+        return None
+
+
+def store(filepath, doc):
+    if not is_enabled():
+        return
+    cache_file = find_cache_file(filepath)
+    if os.path.exists(cache_file):
+        # file name is the content hash, an existing file has the same content
+        return
+    try:
+        write(cache_file, doc)
+    except Exception as e:
+        log.error("could not write cache file %s: %s" % (cache_file, e))
+
+
+def find_cache_file(filepath):
+    if not os.path.exists(filepath):
+        filepath = fix_broken_path(filepath)
+    stat = os.stat(filepath)
+    key = (filepath, stat.st_mtime, stat.st_size)
+    if key not in _hashes:
+        _hashes[key] = content_hash(filepath)
+    return os.path.join(_cache_dir, _hashes[key] + ".dsc")
+
+
+def content_hash(filepath):
+    sha = hashlib.sha1(MAGIC)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def write(cache_file, doc):
+    """cache file layout: magic, header length, pickled header, aligned raw array data.
+    the header holds the document with every numpy array replaced by a marker and the array layout.
+    """
+    arrays = []
+    tree = extract_arrays(doc, arrays)
+
+    layout = []
+    offset = 0
+    for array in arrays:
+        layout.append((array.dtype.str, array.shape, offset))
+        offset = align(offset + array.nbytes)
+    header = pickle.dumps((tree, layout), protocol=pickle.HIGHEST_PROTOCOL)
+    data_start = align(len(MAGIC) + 8 + len(header))
+
+    tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for array, (_, _, array_offset) in zip(arrays, layout):
+            f.seek(data_start + array_offset)
+            f.write(numpy.ascontiguousarray(array).tobytes())
+    os.replace(tmp_file, cache_file)
+
+
+def read(cache_file):
+    with open(cache_file, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a cache file or outdated format")
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        tree, layout = pickle.loads(f.read(header_len))
+        data_start = align(len(MAGIC) + 8 + header_len)
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if len(layout) > 0 else None
+
+    arrays = []
+    for dtype, shape, offset in layout:
+        dtype = numpy.dtype(dtype)
+        count = int(numpy.prod(shape))
+        if count == 0:
+            arrays.append(numpy.zeros(shape, dtype=dtype))
+        else:
+            array = numpy.frombuffer(buf, dtype=dtype, count=count, offset=data_start + offset)
+            arrays.append(array.reshape(shape))
+    return insert_arrays(tree, arrays)
+
+
+def extract_arrays(data, arrays):
+    if isinstance(data, numpy.ndarray):
+        arrays.append(data)
+        return {ARRAY_MARKER: len(arrays) - 1}
+    if isinstance(data, dict):
+        return {k: extract_arrays(v, arrays) for k, v in data.items()}
+    if isinstance(data, list):
+        return [extract_arrays(v, arrays) for v in data]
+    return data
+
+
+def insert_arrays(data, arrays):
+    if isinstance(data, dict):
+        if ARRAY_MARKER in data:
+            return arrays[data[ARRAY_MARKER]]
+        return {k: insert_arrays(v, arrays) for k, v in data.items()}
+    if isinstance(data, list):
+        return [insert_arrays(v, arrays) for v in data]
+    return data
+
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -0,0 +1,24 @@
+import logging
+
+from . import disk_cache
+from .dson_reader import read_document
+
+log = logging.getLogger(__name__)
+
+
+def load_document(filepath, skip=()):
+    """load a dsf/duf file with its large numeric arrays as numpy arrays.
+    uses the on-disk cache if one is configured, otherwise the file is read with the dson reader.
+    top level keys in skip are dropped.
+    """
+    doc = disk_cache.load(filepath)
+    if doc is None and disk_cache.is_enabled():
+        # the cache always stores complete documents
+        doc = read_document(filepath)
+        disk_cache.store(filepath, doc)
+    elif doc is None:
+        return read_document(filepath, skip)
+
+    for key in skip:
+        doc.pop(key, None)
+    return doc
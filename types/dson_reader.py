@@ -0,0 +1,240 @@
+import json
+import logging
+import re
+from json.decoder import scanstring
+
+import numpy
+
+from .util import open_binary_file
+
+log = logging.getLogger(__name__)
+
+# large numeric arrays of a DSON document that are read into numpy arrays instead of nested lists.
+# "*" matches every item of a list or every value of a dict. width None marks ragged rows (polylist),
+# those are padded with -1.
+ARRAY_PATHS = [
+    (("geometry_library", "*", "vertices", "values"), "f4", 3),
+    (("geometry_library", "*", "polylist", "values"), "i4", None),
+    (("uv_set_library", "*", "uvs", "values"), "f4", 2),
+    (("uv_set_library", "*", "polygon_vertex_indices"), "i4", 3),
+    (("modifier_library", "*", "morph", "deltas", "values"), "f4", 4),
+    (("modifier_library", "*", "skin", "joints", "*", "local_weights", "*", "values"), "f4", 2),
+    (("modifier_library", "*", "skin", "joints", "*", "node_weights", "values"), "f4", 2),
+]
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+# end of an array of arrays, the only place where two closing brackets follow each other
+NESTED_ARRAY_END = re.compile(r"\][ \t\n\r]*\]")
+BRACKETS_TO_SPACE = str.maketrans("[]", "  ")
+# numeric arrays are converted in pieces of about this many characters
+PIECE_SIZE = 1 << 22
+
+
+class ArraySpec:
+    def __init__(self, dtype, width):
+        self.dtype = dtype
+        self.width = width
+
+
+def build_path_tree(array_paths):
+    """nested dicts of path keys, leaves are ArraySpecs"""
+    tree = {}
+    for path, dtype, width in array_paths:
+        node = tree
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = ArraySpec(dtype, width)
+    return tree
+
+
+PATH_TREE = build_path_tree(ARRAY_PATHS)
+
+
+def read_document(filepath, skip=()):
+    """read a dsf/duf file. the file is decompressed and decoded into one string, the structure is then
+    walked token by token only along the paths to the large numeric arrays. these are converted piece by
+    piece from the text into a numpy array of their final dtype, without a full copy of their text.
+    everything else is decoded with the json module. top level keys in skip are not kept.
+    """
+    with open_binary_file(filepath) as f:
+        text = f.read().decode('latin1')
+    return DsonReader(text).read(skip)
+
+
+class DsonReader:
+    def __init__(self, text):
+        self.text = text
+        self.decoder = json.JSONDecoder()
+
+    def read(self, skip):
+        idx = self.skip_whitespace(0)
+        doc, idx = self.parse_object(idx, PATH_TREE, skip)
+        return doc
+
+    def skip_whitespace(self, idx):
+        return WHITESPACE.match(self.text, idx).end()
+
+    def parse_value(self, idx, node):
+        if isinstance(node, ArraySpec):
+            return self.parse_array(idx, node)
+        char = self.text[idx]
+        if node is not None and char == '{':
+            return self.parse_object(idx, node)
+        if node is not None and char == '[' and "*" in node:
+            return self.parse_list(idx, node["*"])
+        return self.decoder.raw_decode(self.text, idx)
+
+    def parse_object(self, idx, node, skip=()):
+        text = self.text
+        result = {}
+        idx = self.skip_whitespace(idx + 1)
+        if text[idx] == '}':
+            return result, idx + 1
+        while True:
+            if text[idx] != '"':
+                raise ValueError("expected property name at %d" % idx)
+            key, idx = scanstring(text, idx + 1)
+            idx = self.skip_whitespace(idx)
+            if text[idx] != ':':
+                raise ValueError("expected ':' at %d" % idx)
+            idx = self.skip_whitespace(idx + 1)
+            value, idx = self.parse_value(idx, node.get(key, node.get("*", None)))
+            if key not in skip:
+                result[key] = value
+            idx = self.skip_whitespace(idx)
+            if text[idx] == '}':
+                return result, idx + 1
+            if text[idx] != ',':
+                raise ValueError("expected ',' or '}' at %d" % idx)
+            idx = self.skip_whitespace(idx + 1)
+
+    def parse_list(self, idx, node):
+        text = self.text
+        result = []
+        idx = self.skip_whitespace(idx + 1)
+        if text[idx] == ']':
+            return result, idx + 1
+        while True:
+            value, idx = self.parse_value(idx, node)
+            result.append(value)
+            idx = self.skip_whitespace(idx)
+            if text[idx] == ']':
+                return result, idx + 1
+            if text[idx] != ',':
+                raise ValueError("expected ',' or ']' at %d" % idx)
+            idx = self.skip_whitespace(idx + 1)
+
+    def parse_numbers(self, start, end, dtype, count, convert):
+        """the count numbers of the text from start to end as flat array of dtype, convert turns the
+        brackets of a piece of the text into separators.
+        the text is translated and converted in pieces that end after a row, so the result is the only
+        allocation that grows with the array.
+        """
+        text = self.text
+        result = numpy.empty(count, dtype=dtype)
+        filled = 0
+        pos = start
+        while pos < end:
+            cut = end
+            if pos + PIECE_SIZE < end:
+                row_end = text.find(']', pos + PIECE_SIZE, end)
+                comma = text.find(',', row_end, end) if row_end >= 0 else -1
+                if comma >= 0:
+                    cut = comma
+            values = numpy.fromstring(convert(text[pos:cut]), dtype=dtype, sep=',')
+            if filled + len(values) > count:
+                raise ValueError("not a numeric array")
+            result[filled:filled + len(values)] = values
+            filled += len(values)
+            pos = cut + 1
+        if filled != count:
+            raise ValueError("not a numeric array")
+        return result
+
+    def parse_array(self, idx, spec):
+        """parse an array of numeric rows without creating python objects for its elements"""
+        text = self.text
+        if text[idx] != '[':
+            return self.decoder.raw_decode(text, idx)
+        first = self.skip_whitespace(idx + 1)
+        if text[first] == ']':
+            return empty_array(spec), first + 1
+
+        try:
+            if text[first] != '[':
+                raise ValueError("not an array of rows")
+            match = NESTED_ARRAY_END.search(text, first)
+            if match is None:
+                raise ValueError("unterminated array")
+            end = match.end()
+            if text.find('"', idx, end) >= 0 or text.find('{', idx, end) >= 0:
+                raise ValueError("not a numeric array")
+
+            count = text.count(',', idx, end) + 1
+            if spec.width is not None:
+                if count % spec.width != 0:
+                    raise ValueError("row length does not match")
+                values = self.parse_numbers(idx, end, spec.dtype, count, brackets_to_space)
+                return values.reshape(-1, spec.width), end
+            row_count = text.count(']', idx, end) - 1
+            flat = self.parse_numbers(idx, end, spec.dtype, count + row_count + 1, row_ends_to_separator)
+            return ragged_rows_to_array(flat[:-1], row_count, spec.dtype), end  # drop the separator of the outer array
+        except ValueError as e:
+            # unusual formatting, take the slow path
+            log.debug("falling back to json for array at %d: %s" % (idx, e))
+            rows, end = self.decoder.raw_decode(text, idx)
+            return to_array(rows, spec.dtype, spec.width), end
+
+
+def brackets_to_space(text):
+    return text.translate(BRACKETS_TO_SPACE)
+
+
+def row_ends_to_separator(text):
+    """for ragged rows every closing bracket becomes a -1 separator, their values are non-negative"""
+    return text.replace("[", " ").replace("]", ",-1")
+
+
+def ragged_rows_to_array(flat, row_count, dtype):
+    """rows of non-negative integers with different lengths, e.g. [[0,1,2,3,4],[0,1,2,3,4,5]].
+    flat holds the values of the rows with a -1 after every row, row lengths are derived from their positions.
+    """
+    ends = numpy.nonzero(flat < 0)[0]
+    if len(ends) != row_count or (len(flat) > 0 and flat[-1] >= 0):
+        raise ValueError("not an array of rows")
+    lengths = numpy.diff(numpy.concatenate(([-1], ends))) - 1
+    width = int(lengths.max())
+
+    values = flat[flat >= 0]
+    row_starts = numpy.cumsum(lengths) - lengths
+    rows = numpy.repeat(numpy.arange(len(lengths)), lengths)
+    cols = numpy.arange(len(values)) - numpy.repeat(row_starts, lengths)
+    result = numpy.full((len(lengths), width), -1, dtype=dtype)
+    result[rows, cols] = values
+    return result
+
+
+def empty_array(spec):
+    return numpy.zeros((0, spec.width if spec.width is not None else 0), dtype=spec.dtype)
+
+
+def to_array(rows, dtype, width):
+    if width is not None:
+        return numpy.array(rows, dtype=dtype).reshape(-1, width)
+    return padded_array(rows, dtype)
+
+
+def padded_array(rows, dtype):
+    """convert rows of different length into one array, missing values are -1"""
+    if len(rows) == 0:
+        return numpy.zeros((0, 0), dtype=dtype)
+    lengths = numpy.fromiter(map(len, rows), dtype=numpy.int64, count=len(rows))
+    width = int(lengths.max())
+    if lengths.min() == width:
+        return numpy.array(rows, dtype=dtype)
+
+    result = numpy.full((len(rows), width), -1, dtype=dtype)
+    for length in numpy.unique(lengths):
+        idx = numpy.nonzero(lengths == length)[0]
+        result[idx, :length] = [rows[i] for i in idx]
+    return result
@@ -1,27 +1,109 @@
+import numpy
+
 from .util import vertices_to_blender
 
 
 class Geometry:
+    """vertices are a float32 (N, 3) array in blender coordinates. faces are stored CSR-style: the vertex
+    indices of face i are face_vertices[face_offsets[i]:face_offsets[i + 1]].
+    face_poly_groups and face_mat_groups hold the polygon / material group index of each face.
+    """
     def __init__(self, asset, geom):
         self.asset = asset
         self.id = geom["id"]
-        self.poly_groups = [{"name": name, "vertices": set()} for name in geom["polygon_groups"]["values"]]
-        self.mat_groups = [{"name": name, "vertices": set(), "faces": set()} for name in geom["polygon_material_groups"]["values"]]
+        self.poly_group_names = list(geom["polygon_groups"]["values"])
+        self.mat_group_names = list(geom["polygon_material_groups"]["values"])
         self.vertices = vertices_to_blender(geom["vertices"]["values"])
         self.default_uv_set = self.load_default_uv_set(geom)
-        self.faces = list()
-        for polygon in geom["polylist"]["values"]:
-            (polygroup_index, material_index, v) = (polygon[0], polygon[1], polygon[2:])
-            self.faces.append(v)
-            self.poly_groups[polygroup_index]["vertices"].update(v)
-            self.mat_groups[material_index]["vertices"].update(v)
-            self.mat_groups[material_index]["faces"].update([len(self.faces) - 1])
+
+        # rows are [polygon group, material group, vertex indices...] padded with -1
+        polylist = geom["polylist"]["values"]
+        if polylist.shape[0] == 0:
+            # an empty polylist has no columns either
+            self.face_poly_groups = numpy.zeros(0, dtype=numpy.int32)
+            self.face_mat_groups = numpy.zeros(0, dtype=numpy.int32)
+            self.face_sizes = numpy.zeros(0, dtype=numpy.int32)
+            self.face_offsets = numpy.zeros(1, dtype=numpy.int64)
+            self.face_vertices = numpy.zeros(0, dtype=numpy.int32)
+        else:
+            self.face_poly_groups = polylist[:, 0].astype(numpy.int32)
+            self.face_mat_groups = polylist[:, 1].astype(numpy.int32)
+            corners = polylist[:, 2:]
+            valid = corners >= 0
+            self.face_sizes = valid.sum(axis=1).astype(numpy.int32)
+            self.face_offsets = numpy.zeros(len(polylist) + 1, dtype=numpy.int64)
+            numpy.cumsum(self.face_sizes, out=self.face_offsets[1:])
+            self.face_vertices = corners[valid].astype(numpy.int32)
+        self._face_remap = None
+
+    @property
+    def face_count(self):
+        return len(self.face_sizes)
+
+    @property
+    def face_remap(self):
+        """maps DSON face indices to the faces of the created mesh, invalid faces are left out and map to -1"""
+        if self._face_remap is None:
+            valid = self.valid_faces()
+            self._face_remap = numpy.full(self.face_count, -1, dtype=numpy.int64)
+            self._face_remap[valid] = numpy.arange(numpy.count_nonzero(valid))
+        return self._face_remap
+
+    def mesh_loops(self):
+        """DSON face index and vertex index of every loop of the created mesh, in mesh loop order"""
+        kept = self.face_remap >= 0
+        loop_faces = numpy.repeat(numpy.nonzero(kept)[0], self.face_sizes[kept])
+        loop_vertices = self.face_vertices[numpy.repeat(kept, self.face_sizes)]
+        return loop_faces, loop_vertices
+
+    def valid_faces(self):
+        """faces need at least three distinct, existing vertices and must not repeat an earlier face"""
+        face_ids = numpy.repeat(numpy.arange(self.face_count), self.face_sizes)
+        valid = self.face_sizes >= 3
+
+        out_of_range = (self.face_vertices < 0) | (self.face_vertices >= len(self.vertices))
+        valid[face_ids[out_of_range]] = False
+
+        # sort the vertices of each face, repeated vertices are then next to each other
+        order = numpy.lexsort((self.face_vertices, face_ids))
+        sorted_vertices = self.face_vertices[order]
+        repeated = (sorted_vertices[1:] == sorted_vertices[:-1]) & (face_ids[1:] == face_ids[:-1])
+        valid[face_ids[1:][repeated]] = False
+
+        # faces with the same set of vertices, only the first one is kept
+        if self.face_count > 0:
+            width = int(self.face_sizes.max())
+            sorted_faces = numpy.full((self.face_count, width), -1, dtype=numpy.int64)
+            cols = numpy.arange(len(face_ids)) - numpy.repeat(self.face_offsets[:-1], self.face_sizes)
+            sorted_faces[face_ids, cols] = sorted_vertices
+            candidates = numpy.nonzero(valid)[0]
+            rows = sorted_faces[candidates]
+            # stable sort, so equal rows stay in face order
+            order = numpy.lexsort(rows.T[::-1])
+            same = (rows[order][1:] == rows[order][:-1]).all(axis=1)
+            valid[candidates[order[1:][same]]] = False
+        return valid
 
     def load_default_uv_set(self, geom):
         return self.asset.find_uv_set(geom["default_uv_set"])
 
-    def mat_group_to_faces(self, mat_group):
-        for mg in self.mat_groups:
-            if mg["name"] == mat_group:
-                return mg["faces"]
-        return []
+    def poly_groups(self):
+        return self.group_vertices(self.poly_group_names, self.face_poly_groups)
+
+    def mat_groups(self):
+        return self.group_vertices(self.mat_group_names, self.face_mat_groups)
+
+    def group_vertices(self, names, face_groups):
+        """return a list of (group name, sorted unique vertex indices of all faces in the group)"""
+        corner_groups = numpy.repeat(face_groups, self.face_sizes).astype(numpy.int64)
+        keys = numpy.unique(corner_groups * len(self.vertices) + self.face_vertices)
+        groups = keys // max(len(self.vertices), 1)
+        vertices = (keys - groups * len(self.vertices)).astype(numpy.int32)
+        bounds = numpy.searchsorted(groups, numpy.arange(len(names) + 1))
+        return [(name, vertices[bounds[i]:bounds[i + 1]]) for i, name in enumerate(names)]
+
+    def mat_groups_to_faces(self, mat_groups):
+        """faces of any of the material groups, from the material index of each face in the polylist"""
+        selected = numpy.zeros(len(self.mat_group_names), dtype=bool)
+        selected[[self.mat_group_names.index(g) for g in mat_groups if g in self.mat_group_names]] = True
+        return numpy.nonzero(selected[self.face_mat_groups])[0]
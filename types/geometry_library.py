@@ -2,10 +2,12 @@ from .geometry import Geometry
 
 class GeometryLibrary:
     def __init__(self, asset, json_asset):
+        self.asset = asset
         self.geometries = {}
-        for geom in json_asset.get("geometry_library", []):
-                g = Geometry(asset, geom)
-                self.geometries[g.id] = g
+        # geometries are parsed on first find
+        self.json_geometries = {geom["id"]: geom for geom in json_asset.get("geometry_library", [])}
 
     def find(self, id):
+        if id in self.json_geometries:
+            self.geometries[id] = Geometry(self.asset, self.json_geometries.pop(id))
         return self.geometries.get(id, None)
@@ -8,7 +8,6 @@ log = logging.getLogger(__name__)
 class MaterialLibrary:
     def __init__(self, asset, json_asset):
         self.asset = asset
-        self.json_asset = json_asset
         self.materials = {}
         for json_material in json_asset.get("material_library", []):
             self.parse_material(json_material)
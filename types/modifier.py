@@ -1,5 +1,12 @@
+import numpy
+
 from .material import Channel
 from .morph import Morph
+from .util import Uri
+
+# bone channels that can be formula inputs, e.g. the bend of a thigh for corrective morphs
+BONE_INPUT_TRANSFORMS = ("rotation", "translation")
+
 
 class Modifier:
     def __init__(self, json_modifier):
@@ -28,6 +35,53 @@ class Modifier:
             self.skin = Skin(json_modifier["skin"])
 
 
+class MorphInfo:
+    """summary of a morph modifier, read without parsing its deltas.
+    targets are the ids of the properties the morph's formulas change, bone_inputs the ids of the bones
+    whose channels they read (corrective morphs). the formulas of corrective morphs are kept as well, see
+    formula_tuples, the pose applies them before the morph is ever loaded.
+    """
+    def __init__(self, json_modifier):
+        self.id = json_modifier["id"]
+        chan = json_modifier.get("channel", {})
+        self.label = chan.get("label", "") or self.id
+        self.visible = chan.get("visible", True)
+        self.targets = []
+        self.bone_inputs = []
+        for json_formula in json_modifier.get("formulas", []):
+            target = Uri(json_formula["output"]).asset_id
+            if target not in self.targets:
+                self.targets.append(target)
+            for json_operation in json_formula.get("operations", []):
+                uri = Uri(json_operation["url"]) if "url" in json_operation else None
+                if uri is not None and uri.property_path.split("/")[0] in BONE_INPUT_TRANSFORMS \
+                        and uri.asset_id not in self.bone_inputs:
+                    self.bone_inputs.append(uri.asset_id)
+        self.formulas = []
+        if len(self.bone_inputs) > 0:
+            self.formulas = formula_tuples(Formula(f) for f in json_modifier.get("formulas", []))
+        deltas = json_modifier.get("morph", {}).get("deltas", {})
+        self.delta_count = len(deltas.get("values", []))
+
+    def to_json(self):
+        return {"id": self.id, "label": self.label, "visible": self.visible,
+                "targets": self.targets, "bone_inputs": self.bone_inputs, "delta_count": self.delta_count,
+                "formulas": self.formulas}
+
+    @staticmethod
+    def from_json(json_info):
+        info = MorphInfo.__new__(MorphInfo)
+        info.__dict__.update(json_info)
+        # json turns the tuples into lists
+        info.formulas = [(output, stage, [tuple(operation) for operation in operations])
+                         for output, stage, operations in json_info.get("formulas", [])]
+        return info
+
+
+def is_morph(json_modifier):
+    return "morph" in json_modifier or "formulas" in json_modifier
+
+
 class Formula:
     def __init__(self, json_formula):
         self.output = json_formula["output"]
@@ -42,6 +96,20 @@ class Operation:
         self.url = json_operation.get("url", None)
 
 
+def formula_tuples(formulas):
+    """Formulas as [(output, stage, [(op, val, url)])], the form the morph store keeps them in.
+    formulas with unknown operations are left out.
+    """
+    result = []
+    for formula in formulas:
+        if any(operation.op == "spline_tcb" for operation in formula.operations):
+            continue
+        operations = [(operation.op, operation.val if operation.val else 0.0, operation.url if operation.url else "")
+                      for operation in formula.operations]
+        result.append((formula.output, formula.stage, operations))
+    return result
+
+
 class Skin:
     def __init__(self, json_skin):
         self.node = json_skin["node"]
@@ -60,9 +128,30 @@ class Joint:
         self.node_weights = None
         if "local_weights" in json_joint:
             self.local_weights = {
-                "x": json_joint["local_weights"].get("x", {}).get("values", []),
-                "y": json_joint["local_weights"].get("z", {}).get("values", []),
-                "z": json_joint["local_weights"].get("y", {}).get("values", [])
+                "x": VertexWeights(json_joint["local_weights"].get("x", {}).get("values", [])),
+                "y": VertexWeights(json_joint["local_weights"].get("z", {}).get("values", [])),
+                "z": VertexWeights(json_joint["local_weights"].get("y", {}).get("values", []))
             }
         if "node_weights" in json_joint:
-            self.node_weights = json_joint["node_weights"]["values"]
+            self.node_weights = VertexWeights(json_joint["node_weights"]["values"])
+
+
+class VertexWeights:
+    def __init__(self, values):
+        # rows of [vertex index, weight]
+        values = numpy.asarray(values, dtype=numpy.float32).reshape(-1, 2)
+        self.indices = values[:, 0].astype(numpy.int32)
+        self.weights = values[:, 1]
+
+    def merge(self, other):
+        """merge with other weights, vertices that are present in both get the arithmetic mean"""
+        result = VertexWeights([])
+        result.indices = numpy.union1d(self.indices, other.indices).astype(numpy.int32)
+        weights = numpy.zeros(len(result.indices), dtype=numpy.float32)
+        count = numpy.zeros(len(result.indices), dtype=numpy.float32)
+        for w in (self, other):
+            pos = numpy.searchsorted(result.indices, w.indices)
+            weights[pos] += w.weights
+            count[pos] += 1
+        result.weights = weights / count
+        return result
@@ -4,9 +4,15 @@ class ModifierLibrary:
     def __init__(self, asset, json_asset):
         self.asset = asset
         self.modifiers = {}
-        for json_modifier in json_asset.get("modifier_library", []):
-            modifier = Modifier(json_modifier)
-            self.modifiers[modifier.id] = modifier
+        # modifiers are parsed on first find
+        self.json_modifiers = {m["id"]: m for m in json_asset.get("modifier_library", [])}
 
     def find(self, id):
-        return self.modifiers.get(id, None)
\ No newline at end of file
+        if id in self.json_modifiers:
+            self.modifiers[id] = Modifier(self.json_modifiers.pop(id))
+        return self.modifiers.get(id, None)
+
+    def all(self):
+        for id in list(self.json_modifiers):
+            self.find(id)
+        return list(self.modifiers.values())
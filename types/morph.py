@@ -1,4 +1,12 @@
+import numpy
+
+from .util import vertices_to_blender
+
+
 class Morph:
     def __init__(self, json_morph):
         self.vertex_count = json_morph["vertex_count"]
-        self.vertex_deltas = json_morph["deltas"]["values"]
+        # rows of [vertex index, x, y, z]
+        deltas = json_morph["deltas"]["values"]
+        self.vertex_indices = deltas[:, 0].astype(numpy.int32)
+        self.vertex_deltas = vertices_to_blender(deltas[:, 1:])
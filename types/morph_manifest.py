@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+from . import disk_cache
+from .document import load_document
+from .modifier import MorphInfo, is_morph
+
+log = logging.getLogger(__name__)
+
+# bump when the content of manifests changes, old manifests are then rebuilt
+FORMAT_VERSION = 3
+# everything but the modifier_library of morph files
+SKIPPED_SECTIONS = ("uv_set_library", "geometry_library", "material_library", "image_library", "node_library", "scene")
+
+_manifests = {}  # normalized directory -> MorphManifest, kept for the session
+
+
+class MorphManifest:
+    """index of the morph files below a Morphs directory.
+    holds mtime, size and the MorphInfos of each file and the listing of each directory, so an import
+    neither decodes unchanged files nor lists unchanged directories. stored as json in the cache
+    directory if one is configured, otherwise it lives for the session only.
+    """
+
+    def __init__(self, dir):
+        self.dir = dir
+        self.files = {}  # path relative to dir -> {"mtime", "size", "morphs": [MorphInfo as dict]}
+        self.dirs = {}   # path relative to dir -> {"mtime", "files", "dirs"}
+        self.changed = False
+        self.infos_by_file = {}
+
+    def load(self):
+        manifest_file = self.manifest_file()
+        if manifest_file is None or not os.path.exists(manifest_file):
+            return
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            log.error("could not read morph manifest %s: %s" % (manifest_file, e))
+            return
+        if data.get("version", None) != FORMAT_VERSION:
+            return
+        self.files = data["files"]
+        self.dirs = data["dirs"]
+
+    def save(self):
+        manifest_file = self.manifest_file()
+        if manifest_file is None or not self.changed:
+            return
+        data = {"version": FORMAT_VERSION, "dir": self.dir, "files": self.files, "dirs": self.dirs}
+        tmp_file = "%s.%d.tmp" % (manifest_file, os.getpid())
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, manifest_file)
+            self.changed = False
+        except Exception as e:
+            log.error("could not write morph manifest %s: %s" % (manifest_file, e))
+
+    def manifest_file(self):
+        if not disk_cache.is_enabled():
+            return None
+        name = hashlib.sha1(self.dir.encode("utf-8")).hexdigest()
+        return disk_cache.cache_path(name + ".manifest.json")
+
+    def update(self, read_all=None):
+        """bring the manifest up to date with the directory, only changed files are decoded.
+        read_all: decodes a list of files, see read_all_morph_infos
+        """
+        seen = set()
+        changed = OrderedDict()  # absolute path -> (relative path, stat)
+        for rel_path in self.list_files():
+            seen.add(rel_path)
+            filepath = os.path.join(self.dir, rel_path)
+            stat = os.stat(filepath)
+            entry = self.files.get(rel_path, None)
+            if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+                changed[filepath] = (rel_path, stat)
+
+        read_all = read_all or read_all_morph_infos
+        for filepath, infos in read_all(list(changed)):
+            rel_path, stat = changed[filepath]
+            log.debug("updating morph manifest entry %s" % rel_path)
+            self.files[rel_path] = {
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "morphs": [info.to_json() for info in infos]
+            }
+            self.infos_by_file.pop(rel_path, None)
+            self.changed = True
+
+        for rel_path in set(self.files) - seen:
+            del self.files[rel_path]
+            self.infos_by_file.pop(rel_path, None)
+            self.changed = True
+        self.save()
+
+    def list_files(self):
+        """relative paths of all dsf files, directories whose mtime did not change are not listed again"""
+        result = []
+        seen_dirs = set()
+        pending = [""]
+        while len(pending) > 0:
+            rel_dir = pending.pop()
+            seen_dirs.add(rel_dir)
+            abs_dir = os.path.join(self.dir, rel_dir)
+            mtime = os.stat(abs_dir).st_mtime
+            listing = self.dirs.get(rel_dir, None)
+            if listing is None or listing["mtime"] != mtime:
+                names = sorted(os.listdir(abs_dir))
+                listing = {
+                    "mtime": mtime,
+                    "files": [n for n in names if n.endswith(".dsf") and os.path.isfile(os.path.join(abs_dir, n))],
+                    "dirs": [n for n in names if os.path.isdir(os.path.join(abs_dir, n))]
+                }
+                self.dirs[rel_dir] = listing
+                self.changed = True
+            result.extend(os.path.join(rel_dir, n) for n in listing["files"])
+            pending.extend(os.path.join(rel_dir, n) for n in reversed(listing["dirs"]))
+
+        for rel_dir in set(self.dirs) - seen_dirs:
+            del self.dirs[rel_dir]
+            self.changed = True
+        return result
+
+    def filepaths(self):
+        return [os.path.join(self.dir, rel_path) for rel_path in sorted(self.files)]
+
+    def infos(self, filepath):
+        """MorphInfos of a file below the directory"""
+        rel_path = os.path.relpath(filepath, self.dir)
+        if rel_path not in self.infos_by_file:
+            entry = self.files.get(rel_path, None)
+            morphs = entry["morphs"] if entry is not None else []
+            self.infos_by_file[rel_path] = [MorphInfo.from_json(m) for m in morphs]
+        return self.infos_by_file[rel_path]
+
+
+def read_morph_infos(filepath):
+    """decode a dsf file and return the MorphInfos of its morph modifiers"""
+    doc = load_document(filepath, skip=SKIPPED_SECTIONS)
+    return [MorphInfo(m) for m in doc.get("modifier_library", []) if is_morph(m)]
+
+
+def read_all_morph_infos(filepaths):
+    """yields (filepath, MorphInfos) for each file, files that cannot be read yield no MorphInfos"""
+    for filepath in filepaths:
+        try:
+            infos = read_morph_infos(filepath)
+        except Exception as e:
+            log.error("could not read morphs of %s: %s" % (filepath, e))
+            infos = []
+        yield filepath, infos
+
+
+def get_manifest(dir, read_all=None):
+    """the up to date manifest of a Morphs directory, read_all: see MorphManifest.update"""
+    dir = os.path.normcase(os.path.realpath(dir))
+    manifest = _manifests.get(dir, None)
+    if manifest is None:
+        manifest = MorphManifest(dir)
+        manifest.load()
+        _manifests[dir] = manifest
+    manifest.update(read_all)
+    return manifest
+
+
+def find_manifest(filepath):
+    """the manifest that contains filepath if there is one, does not update it"""
+    dir = os.path.normcase(os.path.realpath(os.path.dirname(filepath)))
+    while dir not in _manifests:
+        parent = os.path.dirname(dir)
+        if parent == dir:
+            return None
+        dir = parent
+    return _manifests[dir]
+
+
+def clear():
+    _manifests.clear()
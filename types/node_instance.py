@@ -4,7 +4,6 @@ import copy
 class NodeInstance:
     def __init__(self, asset, json_node):
         self.asset = asset
-        self.json_node = json_node
 
         self.id = json_node["id"]
         self.url = json_node["url"]
@@ -13,7 +12,7 @@ class NodeInstance:
         self.conform_target = json_node.get("conform_target", None)
 
         self.geometries = []
-        self.parse_geometries()
+        self.parse_geometries(json_node)
 
         self.node = copy.copy(asset.find_node(self.url))
         self.node.parse(json_node)
@@ -21,8 +20,8 @@ class NodeInstance:
     def __getattr__(self, attr):
         return getattr(self.node, attr)
 
-    def parse_geometries(self):
-        for json_geometry in self.json_node.get("geometries", []):
+    def parse_geometries(self, json_node):
+        for json_geometry in json_node.get("geometries", []):
             self.parse_geometry(json_geometry)
 
     def parse_geometry(self, json_geometry):
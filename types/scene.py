@@ -6,51 +6,94 @@ from .material import MaterialInstance
 
 
 class Scene:
+    """nodes, materials, modifiers and animations are parsed on first access,
+    e.g. a pose import only needs the animations and never resolves the nodes' figure files.
+    """
     def __init__(self, asset, json_asset):
         self.asset = asset
-        self.json_asset = json_asset
+        # parts are removed once parsed
+        self.json_scene = json_asset.get("scene", {})
 
-        self.nodes = []
-        self.parse_nodes()
-
-        self.materials = []
-        self.parse_materials()
-
-        self.modifiers = []
-        self.parse_modifiers()
+        self._nodes = None
+        self._materials = None
+        self._modifiers = None
+        self._geometries_by_id = None
 
         #self.bone_rot = defaultdict(lambda: {"x": 0, "y": 0, "z": 0})
-        self.bone_rot = OrderedDict()
-        self.animations = []
-        self.parse_animations()
+        self._bone_rot = None
+        self._animations = None
+
+    @property
+    def nodes(self):
+        if self._nodes is None:
+            self._nodes = []
+            self.parse_nodes()
+        return self._nodes
+
+    def find_geometry(self, id):
+        """geometry instance of one of the nodes by its id"""
+        if self._geometries_by_id is None:
+            self._geometries_by_id = {}
+            for node in self.nodes:
+                for geom in node.geometries:
+                    self._geometries_by_id.setdefault(geom.id, geom)
+        return self._geometries_by_id.get(id, None)
+
+    @property
+    def materials(self):
+        if self._materials is None:
+            self._materials = []
+            self.parse_materials()
+        return self._materials
+
+    @property
+    def modifiers(self):
+        if self._modifiers is None:
+            self._modifiers = []
+            self.parse_modifiers()
+        return self._modifiers
+
+    @property
+    def animations(self):
+        if self._animations is None:
+            self._bone_rot = OrderedDict()
+            self._animations = []
+            self.parse_animations()
+        return self._animations
+
+    @property
+    def bone_rot(self):
+        # bone_rot is filled while parsing the animations
+        self.animations
+        return self._bone_rot
 
     def parse_nodes(self):
-        for json_node in self.json_asset.get("scene", {}).get("nodes", []):
+        for json_node in self.json_scene.pop("nodes", []):
             self.parse_node(json_node)
 
     def parse_node(self, json_node):
         self.nodes.append(NodeInstance(self.asset, json_node))
 
     def parse_materials(self):
-        for json_material in self.json_asset.get("scene", {}).get("materials", []):
+        for json_material in self.json_scene.pop("materials", []):
             self.parse_material(json_material)
 
     def parse_material(self, json_material):
         self.materials.append(MaterialInstance(self.asset, json_material))
 
     def parse_modifiers(self):
-        for json_modifier in self.json_asset.get("scene", {}).get("modifiers", []):
+        for json_modifier in self.json_scene.pop("modifiers", []):
             self.parse_modifier(json_modifier)
 
     def parse_modifier(self, json_modifier):
         self.modifiers.append(ModifierInstance(self.asset, json_modifier))
 
     def parse_animations(self):
-        for json_anim in self.json_asset.get("scene", {}).get("animations", []):
+        for json_anim in self.json_scene.pop("animations", []):
             self.parse_animation(json_anim)
 
     def parse_animation(self, json_anim):
-        self.animations.append(Animation(self.bone_rot, json_anim))
+        self.animations.append(Animation(self._bone_rot, json_anim))
 
 
 class Animation:
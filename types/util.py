@@ -4,6 +4,8 @@ import os
 from math import radians
 import urllib.parse
 
+import numpy
+
 
 def fix_broken_path(path):
     """
@@ -39,16 +41,20 @@ def open_text_file(filename, encoding = 'latin1'):
     """open a binary file and return a readable handle.
      check for compressed files and open with decompression.
     """
+    return codecs.getreader(encoding)(open_binary_file(filename))
+
+
+def open_binary_file(filename):
+    """open a file for reading bytes, compressed files are decompressed"""
     if not os.path.exists(filename):
         filename = fix_broken_path(filename)
 
-    first_bytes = open(filename, 'rb').read(2)
+    with open(filename, 'rb') as f:
+        first_bytes = f.read(2)
     if first_bytes == b'\x1f\x8b':
         # looks like a gzipped file.
-        ifh = gzip.open (filename, 'rb')
-    else:
-        ifh = open(filename, 'rb')
-    return codecs.getreader(encoding)(ifh)
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
 
 
 def extract(json_data, key, default):
@@ -78,7 +84,13 @@ def parse_xyz_coords(json_float_array, default):
 
 
 def vertices_to_blender(vertices):
-    return [coords_to_blender(c) for c in vertices]
+    """convert an (N, 3) array of coordinates in one step, see coords_to_blender"""
+    vertices = numpy.asarray(vertices, dtype=numpy.float32).reshape(-1, 3)
+    result = numpy.empty_like(vertices)
+    result[:, 0] = vertices[:, 0] / 100.0
+    result[:, 1] = vertices[:, 2] / -100.0
+    result[:, 2] = vertices[:, 1] / 100.0
+    return result
 
 
 def coords_to_blender(coords):
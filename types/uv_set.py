@@ -1,16 +1,37 @@
+import numpy
+
+
 class UvSet:
     def __init__(self, json_uv_set):
         self.id = json_uv_set["id"]
-        self.uvs = json_uv_set["uvs"]["values"]
+        self.uvs = json_uv_set["uvs"]["values"]  # float32 (N, 2)
+        # rows of [face index, vertex index, uv index] for face corners that don't use the vertex' uv
         self.polygon_vertex_indices = json_uv_set["polygon_vertex_indices"]
-        self.separate = {(t[0], t[1]): t[2] for t in self.polygon_vertex_indices}
+        self._separate = None
+
+    def loop_uvs(self, loop_faces, loop_vertices):
+        """return the uvs of all face corners (loops) as an (N, 2) array.
+        loop_faces holds the DSON face index and loop_vertices the vertex index of each loop.
+        """
+        uv_indices = numpy.array(loop_vertices, dtype=numpy.int64)
+        if len(self.polygon_vertex_indices) > 0 and len(uv_indices) > 0:
+            keys, uv_idx = self.separate_keys()
+            loop_keys = self.key(loop_faces, loop_vertices)
+            pos = numpy.searchsorted(keys, loop_keys)
+            pos[pos >= len(keys)] = 0
+            found = keys[pos] == loop_keys
+            uv_indices[found] = uv_idx[pos[found]]
+        return self.uvs[uv_indices]
+
+    def separate_keys(self):
+        """sorted (face, vertex) keys of polygon_vertex_indices and their uv indices"""
+        if self._separate is None:
+            pvi = self.polygon_vertex_indices
+            keys = self.key(pvi[:, 0], pvi[:, 1])
+            order = numpy.argsort(keys, kind="mergesort")
+            self._separate = keys[order], pvi[order, 2].astype(numpy.int64)
+        return self._separate
 
-    def get_uvs(self, face_index, verts):
-        uvs = []
-        for v in verts:
-            if (face_index, v) in self.separate:
-                uvidx = self.separate[(face_index, v)]
-            else:
-                uvidx = v
-            uvs.append(self.uvs[uvidx])
-        return uvs
+    @staticmethod
+    def key(faces, vertices):
+        return (numpy.asarray(faces, dtype=numpy.int64) << 32) | numpy.asarray(vertices, dtype=numpy.int64)
@@ -0,0 +1,29 @@
+"""decodes morph files in the worker processes of decode_pool.
+the workers import this file as a top-level module, so it must neither import bpy nor the add-on package.
+the bpy-free modules of the add-on's types package are loaded as package bdst_worker_types instead.
+"""
+import importlib
+import os
+import sys
+from types import ModuleType
+
+PACKAGE = "bdst_worker_types"
+TYPES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "types")
+
+
+def load_module(name):
+    if PACKAGE not in sys.modules:
+        # an empty package, types/__init__.py would import bpy
+        package = ModuleType(PACKAGE)
+        package.__path__ = [TYPES_DIR]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(PACKAGE + "." + name)
+
+
+def read_morph_infos(filepath, cache_dir):
+    """MorphInfos of a dsf file as dicts, see MorphInfo.to_json"""
+    disk_cache = load_module("disk_cache")
+    if disk_cache.get_cache_dir() != cache_dir:
+        disk_cache.configure(cache_dir)
+    morph_manifest = load_module("morph_manifest")
+    return [info.to_json() for info in morph_manifest.read_morph_infos(filepath)]